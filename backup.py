@@ -6,10 +6,12 @@ Functionality to copy multiple files from one location to another efficiently.
 
 import os
 import shutil
+import stat
 import time
 from datetime import datetime
 import concurrent.futures
-from threading import Lock
+import itertools
+from dataclasses import dataclass
 import util
 import configuration
 import log
@@ -22,11 +24,34 @@ CONFIRMATION_FILENAME = "_BACKUP-CONFIRMATION.txt"
 # The string on the end of the final backup folders
 BACKUP_FOLDER_SUFFIX = "BACKUP"
 
-# Variables for threads
-ACTIVE_THREADS = 0
-MAX_THREADS = os.cpu_count()
-THREAD_COUNT_LOCK = Lock()
-THREAD_START_DEPTH = -1
+# Changed files at least this large that haven't changed size are updated in place instead of copied again
+DELTA_COPY_MIN_SIZE = 64 * (2 ** 20)
+
+# Files the backup process keeps in the base of each backup folder
+BACKUP_METADATA_FILENAMES = (CONFIRMATION_FILENAME,)
+
+# The maximum number of threads used to process directories during file preparation
+MAX_THREADS = min(32, (os.cpu_count() or 1) * 2)
+
+# The maximum number of threads used to copy and delete files, kept low since backups are often made to slower
+# external drives
+MAX_COPY_THREADS = min(8, (os.cpu_count() or 1) * 2)
+
+# Directories found within a directory are only processed as separate tasks if there are more than this many
+MIN_DIRECTORIES_PER_SPLIT = 4
+
+# The minimum time in nanoseconds between each update of the progress shown in the console
+PROGRESS_INTERVAL_NS = 100 * (10 ** 6)
+
+# True if directories can be scanned through open descriptors, which isn't supported on Windows
+SCAN_WITH_DIR_FD = os.scandir in os.supports_fd and hasattr(os, "O_DIRECTORY")
+
+# The permissions removed from new directories when they're created, this can only be read by setting it
+CURRENT_UMASK = os.umask(0)
+os.umask(CURRENT_UMASK)
+
+# The permissions new directories are given when they're created
+DEFAULT_DIRECTORY_MODE = 0o777 & ~CURRENT_UMASK
 
 # Variables to track how many files have been processed during the backup process, all are observable
 BACKUP_NUMBER = 0
@@ -41,6 +66,41 @@ BACKUP_PROGRESS = 0
 CURRENT_STATUS = ""
 ERROR = ""
 
+# The total sizes of the new files and the files to delete found during file preparation
+TOTAL_SIZE_NEW = 0
+TOTAL_SIZE_REMOVED = 0
+
+
+@dataclass
+class BackupCounters:
+    """
+    Counts of the files found during file preparation. Each directory is counted separately by the thread that
+    processes it, and those counts are merged together and added to the global variables a few times a second, so
+    the threads never need to share any counters.
+    """
+    processed: int = 0
+    modified: int = 0
+    new: int = 0
+    error: int = 0
+    deleted: int = 0
+    size: int = 0
+    new_size: int = 0
+    removed_size: int = 0
+
+    def merge(self, other):
+        """
+        Add the counts from another set of counters to these ones.
+        :param other: The BackupCounters to add to this one.
+        """
+        self.processed += other.processed
+        self.modified += other.modified
+        self.new += other.new
+        self.error += other.error
+        self.deleted += other.deleted
+        self.size += other.size
+        self.new_size += other.new_size
+        self.removed_size += other.removed_size
+
 
 @log.logger
 def run_backup(config):
@@ -54,114 +114,132 @@ def run_backup(config):
     print("Initializing...", end="\r", flush=True)
     set_status("Initializing...")
     reset_backup_number()
-    log.log("\n" + configuration.config_display_string(config, show_exclusions=True))
-
-    # Loop through every entry in the configuration
-    for input_number in range(1, config.num_entries()+1):
-        input_path = config.get_entry(input_number).input
-        outputs = config.get_entry(input_number).outputs
-        for output_path in outputs:
-            # True if backing up only one file, false if backing up a directory
-            file_mode = os.path.isfile(input_path)
-
-            # Get the name of the folder to make the backup in
-            folder_name = os.path.split(input_path)[1]
-            if file_mode:
-                backup_folder = output_path
-            else:
-                backup_folder = os.path.join(output_path, folder_name + " " + BACKUP_FOLDER_SUFFIX)
-
-            # Start the log messages
-            log.log("\n" + '/' * 60 +
-                    "\n///// INPUT: " + input_path +
-                    "\n///// OUTPUT: " + backup_folder +
-                    "\n" + '/' * 60 + "\n")
-
-            # Mark all the files needed for the backup process
-            print(' ' * 40 + "\nPreparing files for backup from {} to {}...".format(input_path, backup_folder))
-            reset_globals()
-            start_time = time.time()
-            if file_mode:
-                # If backing up one file, create the backed-up filename here
-                filename_no_ext, filename_ext = os.path.splitext(folder_name)
-                output_filename = os.path.join(output_path, filename_no_ext + " " + BACKUP_FOLDER_SUFFIX + filename_ext)
-                new_files, changed_files, remove_files = mark_files(input_path, output_filename, config, input_number)
-            else:
-                new_files, changed_files, remove_files = mark_files(input_path, backup_folder, config, input_number)
-            set_num_marked(len(new_files) + len(changed_files) + len(remove_files))
+    # The size of each input isn't shown, since it would take a full pass over every input before the backup can
+    # start, and the same totals are logged when each input is done
+    log.log("\n" + configuration.config_display_string(config, show_exclusions=True, show_sizes=False))
+
+    # Loop through every input-output pair in the configuration
+    for entry, input_path, file_mode, backup_folder, backup_path in create_backup_jobs(config):
+        # Start the log messages
+        log.log("\n" + '/' * 60 +
+                "\n///// INPUT: " + input_path +
+                "\n///// OUTPUT: " + backup_folder +
+                "\n" + '/' * 60 + "\n")
+
+        # Mark all the files needed for the backup process
+        print(' ' * 40 + "\nPreparing files for backup from {} to {}...".format(input_path, backup_folder))
+        reset_globals()
+        start_time = time.time()
+        new_files, changed_files, remove_files = mark_files(input_path, backup_path if file_mode else backup_folder,
+                                                            entry, config.deep_compare)
+        set_num_marked(len(new_files) + len(changed_files) + len(remove_files))
+        if not file_mode:
+            print()
+        print("File preparation complete.")
+        if NUM_FILES_ERROR > 0:
+            log.log_print("There were {} error(s) reported during file preparation.".format(NUM_FILES_ERROR))
+            print("Please check the log file for more info on the individual errors.")
+
+        # Check that doing this backup won't over-fill the disk, if it will then return
+        has_space, remaining_space, space_difference =\
+            check_space_requirements(changed_files, TOTAL_SIZE_NEW, TOTAL_SIZE_REMOVED, backup_folder)
+        if not has_space:
+            drive_letter, tail = os.path.splitdrive(backup_folder)
+            error_str = "Copying {} to {} may not fit on the {} drive.".format(
+                input_path, backup_folder, drive_letter)
+            error_str += "\nPlease clear up space on the drive you want to copy to and try again."
+            error_str += "\nTry clearing at least {} on the {} drive and trying again.".format(
+                util.bytes_to_string(-1 * remaining_space, 3), drive_letter)
+            log.log_print("\n" + error_str)
+            set_error(error_str)
+            set_status("ERROR: The backup will not fit. Backup process has stopped.")
             if not file_mode:
-                print()
-            print("File preparation complete.")
-            if NUM_FILES_ERROR > 0:
-                log.log_print("There were {} error(s) reported during file preparation.".format(NUM_FILES_ERROR))
-                print("Please check the log file for more info on the individual errors.")
-
-            # Check that doing this backup won't over-fill the disk, if it will then return
-            has_space, remaining_space, space_difference =\
-                check_space_requirements(new_files, changed_files, remove_files, backup_folder)
-            if not has_space:
-                drive_letter, tail = os.path.splitdrive(backup_folder)
-                error_str = "Copying {} to {} may not fit on the {} drive.".format(
-                    input_path, backup_folder, drive_letter)
-                error_str += "\nPlease clear up space on the drive you want to copy to and try again."
-                error_str += "\nTry clearing at least {} on the {} drive and trying again.".format(
-                    util.bytes_to_string(-1 * remaining_space, 3), drive_letter)
-                log.log_print("\n" + error_str)
-                set_error(error_str)
-                set_status("ERROR: The backup will not fit. Backup process has stopped.")
-                if not file_mode:
-                    if util.dir_empty(backup_folder):
-                        util.rmtree(backup_folder)
-                return
-
-            # Make changes to the files found in file preparation
-            print("Backing up files from {} to {}...".format(input_path, backup_folder))
-            num_errors = backup_files(new_files, changed_files, remove_files)
-            end_time = time.time()
-
-            # Backup is complete, report the time taken, space difference, and if any errors occurred
-            complete_str = "Backup complete in {}. ".format(util.time_string(end_time-start_time))
-            if space_difference == 0:
-                if len(remove_files) + len(changed_files) + len(new_files) > 0:
-                    complete_str += "({}{})".format(util.sign_string(space_difference), util.bytes_to_string(
-                        abs(space_difference), precision=2))
-                else:
-                    complete_str += "(No changes)"
-            else:
+                if util.dir_empty(backup_folder):
+                    util.rmtree(backup_folder)
+            return
+
+        # Make changes to the files found in file preparation
+        print("Backing up files from {} to {}...".format(input_path, backup_folder))
+        num_errors = backup_files(new_files, changed_files, remove_files)
+        end_time = time.time()
+
+        # Backup is complete, report the time taken, space difference, and if any errors occurred
+        complete_str = "Backup complete in {}. ".format(util.time_string(end_time-start_time))
+        if space_difference == 0:
+            if len(remove_files) + len(changed_files) + len(new_files) > 0:
                 complete_str += "({}{})".format(util.sign_string(space_difference), util.bytes_to_string(
                     abs(space_difference), precision=2))
-            print("\n" + complete_str)
-            set_status(complete_str)
-            if num_errors > 0:
-                log.log_print("There were {} error(s) reported during the backup.".format(num_errors))
-                print("Please check the log file for more info on the individual errors.")
-
-            # Report on any errors and finalize the backup
-            final_report_str = "Backup complete: {} files processed, {} new files, {} existing files modified, " + \
-                               "{} files removed ({}, {}{})"
-            log.log(final_report_str.format(NUM_FILES_PROCESSED, NUM_FILES_NEW, NUM_FILES_MODIFIED,
-                                            NUM_FILES_DELETED, util.bytes_to_string(TOTAL_SIZE_PROCESSED, 2),
-                                            util.sign_string(space_difference),
-                                            util.bytes_to_string(abs(space_difference), precision=2)))
-            if NUM_FILES_ERROR > 0:
-                log.log_print("There were {} error(s) reported during this backup.".format(NUM_FILES_ERROR))
-                print("Please check the log file for more info on the individual errors.")
-            if not os.path.isfile(input_path):
-                create_backup_text_file(backup_folder)
-            increment_backup_number()
-
-
-def mark_files(input_path, output_path, config, input_number, depth=0):
+            else:
+                complete_str += "(No changes)"
+        else:
+            complete_str += "({}{})".format(util.sign_string(space_difference), util.bytes_to_string(
+                abs(space_difference), precision=2))
+        print("\n" + complete_str)
+        set_status(complete_str)
+        if num_errors > 0:
+            log.log_print("There were {} error(s) reported during the backup.".format(num_errors))
+            print("Please check the log file for more info on the individual errors.")
+
+        # Report on any errors and finalize the backup
+        final_report_str = "Backup complete: {} files processed, {} new files, {} existing files modified, " + \
+                           "{} files removed ({}, {}{})"
+        log.log(final_report_str.format(NUM_FILES_PROCESSED, NUM_FILES_NEW, NUM_FILES_MODIFIED,
+                                        NUM_FILES_DELETED, util.bytes_to_string(TOTAL_SIZE_PROCESSED, 2),
+                                        util.sign_string(space_difference),
+                                        util.bytes_to_string(abs(space_difference), precision=2)))
+        if NUM_FILES_ERROR > 0:
+            log.log_print("There were {} error(s) reported during this backup.".format(NUM_FILES_ERROR))
+            print("Please check the log file for more info on the individual errors.")
+        log.flush()
+        if not file_mode:
+            create_backup_text_file(backup_folder)
+        increment_backup_number()
+
+
+def create_backup_jobs(config):
+    """
+    Make a list of every backup that needs to be done for a configuration, one for each input-output pair, in the
+    order they appear in the configuration. Everything that only depends on the configuration is worked out here
+    once, before any of the backups start.
+    :param config: A configuration containing paths to folders to backup.
+    :return: A list of tuples, each holding five values: first the entry being backed up, second its
+             input path, third true if the input is a single file or false if it's a directory, fourth the folder
+             the backup is made in, and fifth the path in the output the input is backed up to.
+    """
+    jobs = []
+    for entry in config.entries:
+        input_path = entry.input
+
+        # True if backing up only one file, false if backing up a directory
+        file_mode = os.path.isfile(input_path)
+
+        # Get the name of the folder to make the backup in, or the name of the file if backing up only one file
+        folder_name = os.path.basename(input_path)
+        if file_mode:
+            filename_no_ext, filename_ext = os.path.splitext(folder_name)
+            backup_name = filename_no_ext + " " + BACKUP_FOLDER_SUFFIX + filename_ext
+        else:
+            backup_name = folder_name + " " + BACKUP_FOLDER_SUFFIX
+
+        for output_path in entry.outputs:
+            backup_path = os.path.join(output_path, backup_name)
+            backup_folder = output_path if file_mode else backup_path
+            jobs.append((entry, input_path, file_mode, backup_folder, backup_path))
+    return jobs
+
+
+def mark_files(input_path, output_path, entry, deep_compare=True):
     """
     This is the file preparation stage of the backup process. The directory to be backed up is walked through, and
     all new files, changed files, and files that should be deleted are compiled into their respective lists,
     essentially "marking" those files for later. While the directory is walked, a directory skeleton structure
     is created in the output, so any directories that will have files sent to them later will exist in the output.
+    Each directory is processed as a separate task on a pool of threads, and the directories found within it are
+    submitted as new tasks as soon as it's done.
     :param input_path: The file or directory to backup.
     :param output_path: The file or directory in the drive to backup to.
-    :param config: The current configuration.
-    :param input_number: The index of the entry currently being worked with, starting from 1.
-    :param depth: The depth of the recursive search. Will be 0 if not specified.
+    :param entry: The configuration entry currently being worked with.
+    :param deep_compare: True to compare the contents of files that might have changed. True by default.
     :return: A tuple of three lists is returned.
              First is a list of new files. Each element of this list is a tuple of three values: first the absolute
              file path, second that file's size in bytes, and third the absolute file path from the output.
@@ -171,169 +249,254 @@ def mark_files(input_path, output_path, config, input_number, depth=0):
              Third is a list of files to delete. Each element of this list is a tuple of two values: first the absolute
              file path from the output, and second that file's size in bytes.
     """
-    global THREAD_START_DEPTH
     # Don't continue down this path if it should be excluded
-    if config.get_entry(input_number).should_exclude(input_path, output_path):
+    if entry.should_exclude(input_path, output_path):
         log.log("EXCLUDED - " + input_path)
         return [], [], []
 
     # If this is a file, check what to do with it and increment counters as necessary
-    if os.path.isfile(input_path):
-        file_size = os.path.getsize(input_path)
-        if os.path.exists(output_path):
-            if not util.file_compare(input_path, output_path):
-                # The file has changed and will be added to the update list
-                mark_file_processed(file_size, modified=True)
-                return [], [(input_path, file_size, output_path, os.path.getsize(output_path))], []
-            else:
-                # The file needs no attention
-                mark_file_processed(file_size)
-                return [], [], []
-        else:
-            # The file is new and will be added to the new list
-            mark_file_processed(file_size, is_new=True)
-            return [(input_path, file_size, output_path)], [], []
-
-    # Otherwise, it's a directory, so recurse on each child of the directory
-    else:
+    input_stats = os.stat(input_path)
+    if stat.S_ISREG(input_stats.st_mode):
+        try:
+            output_stats = os.stat(output_path, follow_symlinks=False)
+        except FileNotFoundError:
+            output_stats = None
         new_files = []
         changed_files = []
-        remove_files = []
-
-        # If this directory doesn't exist in the output, make it
-        if not os.path.exists(output_path):
-            try:
-                os.mkdir(output_path)
-                shutil.copymode(input_path, output_path)
-            except PermissionError:
-                # Log the exception and return so we don't process any of this directory's children
-                log.log_exception(output_path, "CREATING DIRECTORY")
-                increment_error()
-                return [], [], []
-
-        # Initialize values that will help in efficiently gathering names of files to remove
-        input_dir_files = os.listdir(input_path)
-        output_dir_files = os.listdir(output_path)
-        output_dir_idx = 0
-        len_output_dir = len(output_dir_files)
-        param_list = []
-
-        # Start by sorting the file lists so we can index them and compare them side by side
-        input_dir_files.sort()
-        output_dir_files.sort()
-
-        try:
-            # Check every file in the input
-            for input_dir_idx in range(len(input_dir_files)):
-                filename = input_dir_files[input_dir_idx]
-                new_input = os.path.join(input_path, filename)
-                new_output = os.path.join(output_path, filename)
-
-                # Loop to check if this file exists in the output as well by looping through output files
-                while output_dir_idx < len_output_dir:
-                    # If it does, index over it and leave the loop, leaving the file in the output alone
-                    if filename == output_dir_files[output_dir_idx]:
-                        output_dir_idx += 1
-                        break
-                    # If this output file isn't the current input file, add it to the remove list
-                    else:
-                        # Stop checking if we are beyond where this file would alphabetically be
-                        if filename < output_dir_files[output_dir_idx]:
-                            break
-                        else:
-                            output_filename = os.path.join(output_path, output_dir_files[output_dir_idx])
-                            # Only add this to the list if it's not the old confirmation file
-                            if not output_dir_files[output_dir_idx] == CONFIRMATION_FILENAME or \
-                                    not input_path == config.get_entry(input_number).input:
-                                if os.path.isdir(output_filename):
-                                    delete_size, delete_files = util.directory_size(output_filename)
-                                    for _ in range(delete_files):
-                                        mark_file_processed(deleted=True)
-                                else:
-                                    mark_file_processed(deleted=True)
-                                remove_files.append((output_filename, os.path.getsize(output_filename)))
-                            output_dir_idx += 1
-
-                # If this is a directory, save parameters to spawn a thread later
-                if os.path.isdir(new_input):
-                    param_list.append([new_input, new_output, config, input_number, depth+1])
-                # Otherwise, recurse and process this file here
-                else:
-                    temp_new, temp_changed, temp_remove = mark_files(new_input, new_output, config, input_number,
-                                                                     depth+1)
-                    new_files.extend(temp_new)
-                    changed_files.extend(temp_changed)
-                    remove_files.extend(temp_remove)
-
-            # In spawn_threads mode, execute each list of parameters on a separate thread and combine the results
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                futures = []
-                # Don't spawn a new thread if only one set of parameters is in the list
-                if len(param_list) == 1:
-                    temp_new, temp_changed, temp_remove = mark_files(*param_list[0])
-                    new_files.extend(temp_new)
-                    changed_files.extend(temp_changed)
-                    remove_files.extend(temp_remove)
-                else:
-                    for params in param_list:
-                        # Only spawn new threads around the same depth in the file heirarchy
-                        if ACTIVE_THREADS < MAX_THREADS and (depth <= THREAD_START_DEPTH+1 or THREAD_START_DEPTH == -1):
-                            if THREAD_START_DEPTH == -1:
-                                THREAD_START_DEPTH = depth
-                            edit_thread_count(1)
-                            futures.append(executor.submit(mark_files, *params))
-                        else:
-                            temp_new, temp_changed, temp_remove = mark_files(*params)
-                            new_files.extend(temp_new)
-                            changed_files.extend(temp_changed)
-                            remove_files.extend(temp_remove)
-            results = [f.result() for f in futures]
-            edit_thread_count(-1 * len(results))
-            for (temp_new, temp_changed, temp_remove) in results:
+        counts = BackupCounters()
+        mark_file(input_path, input_stats, output_path, output_stats, new_files, changed_files, counts, deep_compare)
+        add_file_counts(counts)
+        return new_files, changed_files, []
+
+    # Otherwise, it's a directory, so process it and every directory found within it on the thread pool
+    new_files = []
+    changed_files = []
+    remove_files = []
+    last_progress_time = 0
+    unpublished_counts = BackupCounters()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
+        pending = {executor.submit(mark_directory, input_path, output_path, entry, deep_compare)}
+        while len(pending) > 0:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                temp_new, temp_changed, temp_remove, sub_directories, counts = future.result()
+                unpublished_counts.merge(counts)
                 new_files.extend(temp_new)
                 changed_files.extend(temp_changed)
                 remove_files.extend(temp_remove)
-
-            # If there's still more files in the output that weren't looped over, add them all to the remove list
-            if output_dir_idx < len_output_dir:
-                for end_output_idx in range(output_dir_idx, len(output_dir_files)):
-                    output_filename = os.path.join(output_path, output_dir_files[end_output_idx])
-                    # Only add this to the list if it's not the old confirmation file
-                    if not output_dir_files[end_output_idx] == CONFIRMATION_FILENAME or \
-                            not input_path == config.get_entry(input_number).input:
-                        if os.path.isdir(output_filename):
-                            delete_size, delete_files = util.directory_size(output_filename)
-                            for _ in range(delete_files):
-                                mark_file_processed(deleted=True)
-                        else:
-                            mark_file_processed(deleted=True)
-                        remove_files.append((output_filename, os.path.getsize(output_filename)))
-
-        except FileNotFoundError as error:
-            # Display a warning if long paths need to be enabled on Windows
-            if len(input_path) >= 260:
-                print("FileNotFoundError: Unable to access " + input_path)
-                print("This is likely because the file path is longer than 260 characters.")
-                print("If you are running this on Windows, set LongPathsEnabled to 1 in your registry.")
+                for sub_input, sub_output in sub_directories:
+                    pending.add(executor.submit(mark_directory, sub_input, sub_output, entry, deep_compare))
+
+            # Publish the counts and show the current progress, at most a few times a second and always once
+            # everything is found, so observers aren't notified once for every directory
+            current_time = time.monotonic_ns()
+            if current_time - last_progress_time >= PROGRESS_INTERVAL_NS or len(pending) == 0:
+                last_progress_time = current_time
+                add_file_counts(unpublished_counts)
+                unpublished_counts = BackupCounters()
+                progress_str = "{} files found, {} ({} new, {} changed, {} to remove)".format(
+                    NUM_FILES_PROCESSED, util.bytes_to_string(TOTAL_SIZE_PROCESSED, 2), NUM_FILES_NEW,
+                    NUM_FILES_MODIFIED, NUM_FILES_DELETED)
+                print(progress_str + ' '*10, end="\r", flush=True)
+    return new_files, changed_files, remove_files
+
+
+def mark_directory(input_path, output_path, entry, deep_compare=True):
+    """
+    Mark the files within a directory for the file preparation stage of the backup process. This is run as one
+    task on the thread pool. Directories with only a few directories within them have those processed here as
+    well, since it isn't worth making a separate task for each, but when a directory has more than that, they're
+    returned so they can be processed separately.
+    :param input_path: The directory to backup.
+    :param output_path: The directory in the drive to backup to.
+    :param entry: The configuration entry currently being worked with.
+    :param deep_compare: True to compare the contents of files that might have changed. True by default.
+    :return: A tuple of four lists followed by the BackupCounters for every directory processed here. The first three
+             lists are new files, changed files, and files to delete, in the same format as mark_files(). The fourth
+             is a list of tuples for each directory that should be processed next, holding the directory's path
+             followed by its path in the output.
+    """
+    new_files = []
+    changed_files = []
+    remove_files = []
+    sub_directories = []
+    counts = BackupCounters()
+    directories_to_check = [(input_path, output_path)]
+    while len(directories_to_check) > 0:
+        current_input, current_output = directories_to_check.pop()
+        temp_directories = scan_directory(current_input, current_output, entry, new_files, changed_files,
+                                          remove_files, counts, deep_compare)
+        # Only hand the directories found back to the thread pool if there are enough to be worth spreading out
+        if len(temp_directories) > MIN_DIRECTORIES_PER_SPLIT:
+            sub_directories.extend(temp_directories)
+        else:
+            directories_to_check.extend(temp_directories)
+    return new_files, changed_files, remove_files, sub_directories, counts
+
+
+def scan_directory(input_path, output_path, entry, new_files, changed_files, remove_files, counts,
+                   deep_compare=True):
+    """
+    Mark the files within a single directory for the file preparation stage of the backup process. If the directory
+    doesn't exist in the output, it will be created. Directories within this one are not processed here, and are
+    instead returned so they can be processed separately.
+    :param input_path: The directory to backup.
+    :param output_path: The directory in the drive to backup to.
+    :param entry: The configuration entry currently being worked with.
+    :param new_files: The list of new files to add to, in the same format as mark_files().
+    :param changed_files: The list of changed files to add to, in the same format as mark_files().
+    :param remove_files: The list of files to delete to add to, in the same format as mark_files().
+    :param counts: The BackupCounters to count the files in this directory in.
+    :param deep_compare: True to compare the contents of files that might have changed. True by default.
+    :return: A list of tuples for each directory within this one, holding the directory's path followed by its
+             path in the output.
+    """
+    sub_directories = []
+
+    # If this directory doesn't exist in the output, make it, which is tried without checking if it exists first
+    output_is_new = False
+    try:
+        os.mkdir(output_path)
+        output_is_new = True
+        # Give the new directory the input's permissions, which only need to be set if they aren't the default
+        mode = stat.S_IMODE(os.stat(input_path).st_mode)
+        if os.name == "nt" or mode != DEFAULT_DIRECTORY_MODE:
+            os.chmod(output_path, mode)
+    except FileExistsError:
+        pass
+    except PermissionError:
+        # Log the exception and return so we don't process any of this directory's children
+        log.log_exception(output_path, "CREATING DIRECTORY")
+        counts.error += 1
+        return sub_directories
+
+    input_fd = None
+    output_fd = None
+    try:
+        # Where it's supported, scan both directories through open descriptors, so each child is looked up relative
+        # to its directory rather than by walking its full path again
+        if SCAN_WITH_DIR_FD:
+            input_fd = os.open(input_path, os.O_RDONLY | os.O_DIRECTORY)
+            if not output_is_new:
+                output_fd = os.open(output_path, os.O_RDONLY | os.O_DIRECTORY)
+
+        # Scan both directories once, the entries found hold the information needed about each child. An output
+        # directory that was just made is known to be empty, so it doesn't need to be scanned
+        with os.scandir(input_path if input_fd is None else input_fd) as scanner:
+            input_dir_entries = list(scanner)
+        output_dir_entries = {}
+        if not output_is_new:
+            with os.scandir(output_path if output_fd is None else output_fd) as scanner:
+                output_dir_entries = {dir_entry.name: dir_entry for dir_entry in scanner}
+
+        # The paths of every child are built onto these, which end in a separator
+        input_prefix = os.path.join(input_path, "")
+        output_prefix = os.path.join(output_path, "")
+
+        # Anything in the output that isn't in the input is added to the remove list
+        if len(output_dir_entries) > 0:
+            input_names = {dir_entry.name for dir_entry in input_dir_entries}
+            for removed_name in output_dir_entries.keys() - input_names:
+                mark_removed(output_dir_entries[removed_name], output_prefix + removed_name, input_path, entry,
+                             remove_files, counts)
+
+        # Check every file in the input
+        for child_entry in input_dir_entries:
+            filename = child_entry.name
+            new_input = input_prefix + filename
+            new_output = output_prefix + filename
+            output_entry = output_dir_entries.get(filename)
+
+            # Don't continue down this path if it should be excluded
+            if entry.should_exclude(new_input, new_output):
+                log.log("EXCLUDED - " + new_input)
+            # If this is a directory, save it to be processed separately
+            elif child_entry.is_dir():
+                sub_directories.append((new_input, new_output))
+            # Otherwise, process this file here using what was found when scanning both directories
             else:
-                print(error)
-            exit(1)
-
-        # Show the current progress and return
-        progress_str = "{} files found, {} ({} new, {} changed, {} to remove)".format(
-            NUM_FILES_PROCESSED, util.bytes_to_string(TOTAL_SIZE_PROCESSED, 2), NUM_FILES_NEW,
-            NUM_FILES_MODIFIED, NUM_FILES_DELETED)
-        print(progress_str + ' '*10, end="\r", flush=True)
-        return new_files, changed_files, remove_files
+                output_stats = output_entry.stat(follow_symlinks=False) if output_entry is not None else None
+                mark_file(new_input, child_entry.stat(), new_output, output_stats, new_files, changed_files, counts,
+                          deep_compare)
+
+    except FileNotFoundError as error:
+        # Display a warning if long paths need to be enabled on Windows
+        if len(input_path) >= 260:
+            print("FileNotFoundError: Unable to access " + input_path)
+            print("This is likely because the file path is longer than 260 characters.")
+            print("If you are running this on Windows, set LongPathsEnabled to 1 in your registry.")
+        else:
+            print(error)
+        exit(1)
+    finally:
+        if input_fd is not None:
+            os.close(input_fd)
+        if output_fd is not None:
+            os.close(output_fd)
+    return sub_directories
+
+
+def mark_file(input_path, input_stats, output_path, output_stats, new_files, changed_files, counts,
+              deep_compare=True):
+    """
+    Check what needs to be done to back up a single file, adding it to the new or changed list if it needs to be
+    copied, and increment counters as necessary.
+    :param input_path: The file to backup.
+    :param input_stats: The result of os.stat() on the file to backup.
+    :param output_path: The path that file is backed up to.
+    :param output_stats: The result of os.stat() on the backed up file, or None if it doesn't exist yet.
+    :param new_files: The list of new files to add to, in the same format as mark_files().
+    :param changed_files: The list of changed files to add to, in the same format as mark_files().
+    :param counts: The BackupCounters to count this file in.
+    :param deep_compare: True to compare the contents of the files if they might have changed. True by default.
+    """
+    file_size = input_stats.st_size
+    if output_stats is None:
+        # The file is new and will be added to the new list
+        mark_file_processed(counts, file_size, is_new=True)
+        new_files.append((input_path, file_size, output_path))
+    elif not util.file_compare(input_path, output_path, stats1=input_stats, stats2=output_stats,
+                               deep_compare=deep_compare):
+        # The file has changed and will be added to the update list
+        mark_file_processed(counts, file_size, modified=True)
+        changed_files.append((input_path, file_size, output_path, output_stats.st_size))
+    else:
+        # The file needs no attention
+        mark_file_processed(counts, file_size)
+
+
+def mark_removed(output_entry, output_path, input_path, entry, remove_files, counts):
+    """
+    Mark a file or directory in the output that no longer exists in the input to be deleted.
+    :param output_entry: The os.DirEntry of the file or directory in the output.
+    :param output_path: The full path of the file or directory in the output.
+    :param input_path: The directory in the input the output's parent directory corresponds to.
+    :param entry: The configuration entry currently being worked with.
+    :param remove_files: The list of files to delete to add to, in the same format as mark_files().
+    :param counts: The BackupCounters to count the deleted files in.
+    """
+    # Don't delete any of the backup's own files from the base of the backup folder
+    if output_entry.name in BACKUP_METADATA_FILENAMES and input_path == entry.input:
+        return
+    # A directory is counted as every file within it, all at once, and its size is the size of those files
+    if output_entry.is_dir():
+        delete_size, delete_files = util.directory_size(output_path)
+        counts.deleted += delete_files
+    else:
+        delete_size = output_entry.stat().st_size
+        mark_file_processed(counts, deleted=True)
+    counts.removed_size += delete_size
+    remove_files.append((output_path, delete_size))
 
 
-def check_space_requirements(new_files, changed_files, remove_files, output_path):
+def check_space_requirements(changed_files, new_size, removed_size, output_path):
     """
-    Given lists of new files, changed files, and files to delete, this checks that the drive these file changes
-    will be made on will be able to hold all the new files.
-    :param new_files: A list of new files to backup generated by mark_files().
+    Given the changed files and the total sizes of new files and files to delete, this checks that the drive these
+    file changes will be made on will be able to hold all the new files. The totals are counted during file
+    preparation, so the lists of new files and files to delete don't need to be gone through again.
     :param changed_files: A list of changed files to backup generated by mark_files().
-    :param remove_files: A list of files to delete from the backup generated by mark_files().
+    :param new_size: The total size in bytes of the new files to backup.
+    :param removed_size: The total size in bytes of the files to delete from the backup.
     :param output_path: The path where the backup will be made.
     :return: A tuple of three values. First, true if the backup will fit on the drive, false otherwise. Second, the
              remaining free space on the target drive in bytes. This will be negative if the backup won't fit.
@@ -342,18 +505,16 @@ def check_space_requirements(new_files, changed_files, remove_files, output_path
     """
     total, used, free = shutil.disk_usage(output_path)
     original_free = free
-    # Increase the free space on the drive for every file deleted
-    for file_tuple in remove_files:
-        free += file_tuple[1]
-    # Decrease the free space on the drive for every new file added
-    for file_tuple in new_files:
-        free -= file_tuple[1]
-    # Increase free space when the old changed file is deleted, then decrease for the space of the new version
-    for file_tuple in changed_files:
-        free = free - file_tuple[1] + file_tuple[3]
+    # Increase the free space on the drive for the files deleted, and decrease it for the new files added
+    free += removed_size - new_size
+    # Increase free space when the old changed file is deleted, then decrease for the space of the new version,
+    # keeping a running total after each file
+    free_after_changes = itertools.accumulate((file_tuple[3] - file_tuple[1] for file_tuple in changed_files),
+                                              initial=free)
+    for free in itertools.islice(free_after_changes, 1, None):
         # If free space ever dips below 0 during this, return
         if free <= 0:
-            return free > 0, free, original_free - free
+            break
     return free > 0, free, original_free - free
 
 
@@ -371,85 +532,138 @@ def backup_files(new_files, changed_files, remove_files):
     if len(new_files) == 0 and len(changed_files) == 0 and len(remove_files) == 0:
         print("No changes are needed.", end="\r", flush=True)
 
-    # Prepare values that will track the progress of each section of the backup
-    num_errors = 0
-    count = 0
-    limit = NUM_FILES_DELETED
+    # Delete every file in the remove list, then copy over every file in the new list, then overwrite every file in
+    # the changed list, all on the same threads
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_COPY_THREADS) as executor:
+        num_errors = process_files(executor, remove_files, delete_file, "Deleting {}", "Deleting old files: {}/{}",
+                                   NUM_FILES_DELETED)
+        num_errors += process_files(executor, new_files, copy_new_file, "Copying over {} ({})",
+                                    "Copying over new files: {}/{}")
+        num_errors += process_files(executor, changed_files, copy_changed_file, "Updating {}, ({})",
+                                    "Updating existing files: {}/{}")
+    return num_errors
 
-    # Delete every file in the remove list
-    for file_tuple in remove_files:
-        delete_file_path = file_tuple[0]
-        # Use the correct delete function based on if it's a file or folder
-        try:
-            set_status("Deleting {}".format(os.path.split(delete_file_path)[1]))
-            if os.path.isdir(delete_file_path):
-                deleted_file_count = util.rmtree(delete_file_path)
-                for _ in range(deleted_file_count):
-                    count += 1
-                    print("Deleting old files: {}/{}".format(count, limit) + ' '*20, end="\r", flush=True)
-                increment_backup_progress()
-            else:
-                os.remove(delete_file_path)
-                increment_backup_progress()
-                count += 1
-                print("Deleting old files: {}/{}".format(count, limit) + ' '*20, end="\r", flush=True)
-            log.log("DELETED - " + delete_file_path)
-        except PermissionError:
-            # Log the exception and indicate that an error occurred
-            log.log_exception(delete_file_path, "DELETING")
-            num_errors += 1
-
-    # Reset the counter values and copy over every file in the new list
-    count = 0
-    limit = len(new_files)
-    for file_tuple in new_files:
-        new_file = file_tuple[0]
-        output_path = file_tuple[2]
-        try:
-            set_status("Copying over {} ({})".format(os.path.split(new_file)[1],
-                                                     util.bytes_to_string(os.path.getsize(new_file), 2)))
-            shutil.copy2(new_file, output_path)
-            log.log("NEW - " + output_path)
-        except PermissionError:
-            # Write the full error to the log file and record that an error occurred
-            log.log_exception(output_path, "CREATING")
-            num_errors += 1
-        count += 1
-        increment_backup_progress()
-        print("Copying over new files: {}/{}".format(count, limit) + ' '*20, end="\r", flush=True)
-
-    # Reset the counter values and overwrite every file in the changed list
+
+def process_files(executor, file_list, file_function, status_format, progress_format, total_files=None):
+    """
+    Delete or copy every file in a list using a pool of threads, so one file being slow to read or write doesn't
+    hold up the rest. Only a few files are given to the threads at a time. The status and progress are updated from
+    this thread a few times a second, with the status showing the latest file that was started. Every file in the
+    list is finished before this returns.
+    :param executor: The ThreadPoolExecutor the files are processed on.
+    :param file_list: A list of new, changed, or removed files generated by mark_files().
+    :param file_function: The function that deletes or copies one file, which takes a tuple from the list and
+                          returns the number of files it handled, or None if there was an error.
+    :param status_format: The format of the status set when starting each file, given the file's name and size.
+    :param progress_format: The format of the progress shown in the console, given the number of files done
+                            and the total number of files.
+    :param total_files: The total number of files shown in the progress, if it's different from the number of
+                        files in the list, such as when a directory being deleted holds many files. None by default.
+    :return: The number of errors that occurred.
+    """
+    if total_files is None:
+        total_files = len(file_list)
+    num_errors = 0
     count = 0
-    limit = len(changed_files)
-    for file_tuple in changed_files:
-        new_file = file_tuple[0]
-        output_path = file_tuple[2]
-        try:
-            set_status("Updating {}, ({})".format(os.path.split(new_file)[1],
-                                                  util.bytes_to_string(os.path.getsize(new_file), 2)))
-            shutil.copy2(new_file, output_path)
-            log.log("UPDATED - " + output_path)
-        except PermissionError:
-            # Write the full error to the log file and record that an error occurred
-            log.log_exception(output_path, "UPDATING")
-            num_errors += 1
-        count += 1
-        increment_backup_progress()
-        print("Updating existing files: {}/{}".format(count, limit) + ' '*20, end="\r", flush=True)
+    num_finished = 0
+    unpublished_finished = 0
+    last_started = None
+    last_progress_time = 0
+    files_to_process = iter(file_list)
+    pending = set()
+    while True:
+        # Keep every thread busy with a file waiting behind it
+        for file_tuple in itertools.islice(files_to_process, 2 * MAX_COPY_THREADS - len(pending)):
+            pending.add(executor.submit(file_function, file_tuple))
+            last_started = file_tuple
+        if len(pending) == 0:
+            break
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            files_handled = future.result()
+            if files_handled is None:
+                num_errors += 1
+                files_handled = 1
+            count += files_handled
+            num_finished += 1
+            unpublished_finished += 1
+
+        # Publish the progress and the latest file started, and show the progress in the console, at most a few
+        # times a second and always after the last file, so observers aren't notified once for every file
+        current_time = time.monotonic_ns()
+        if current_time - last_progress_time >= PROGRESS_INTERVAL_NS or num_finished == len(file_list):
+            last_progress_time = current_time
+            if last_started is not None:
+                set_status(status_format.format(os.path.split(last_started[0])[1],
+                                                util.bytes_to_string(last_started[1], 2)))
+                last_started = None
+            if unpublished_finished > 0:
+                increment_backup_progress(unpublished_finished)
+                unpublished_finished = 0
+            print(progress_format.format(count, total_files) + ' '*20, end="\r", flush=True)
     return num_errors
 
 
-def edit_thread_count(offset):
+def delete_file(file_tuple):
     """
-    Thread-safe function for modifying the active thread count by a given offset.
-    :param offset: Value to add to the active thread counter.
+    Delete a file or folder from the backup that no longer exists in the input. This is run on the threads used by
+    process_files(). Nothing else in the lists can be within a folder being deleted, so it's safe to delete it
+    while other files are being deleted.
+    :param file_tuple: A tuple from the list of files to delete generated by mark_files().
+    :return: The number of files deleted, or None if there was an error.
     """
-    global ACTIVE_THREADS
-    THREAD_COUNT_LOCK.acquire()
+    delete_file_path = file_tuple[0]
+    # Use the correct delete function based on if it's a file or folder
     try:
-        ACTIVE_THREADS += offset
-    finally:
-        THREAD_COUNT_LOCK.release()
+        if os.path.isdir(delete_file_path):
+            deleted_file_count = util.rmtree(delete_file_path)
+        else:
+            os.remove(delete_file_path)
+            deleted_file_count = 1
+        log.log("DELETED - " + delete_file_path)
+    except PermissionError:
+        # Log the exception and indicate that an error occurred
+        log.log_exception(delete_file_path, "DELETING")
+        return None
+    return deleted_file_count
+
+
+def copy_new_file(file_tuple):
+    """
+    Copy a new file into the backup. This is run on the threads used by process_files().
+    :param file_tuple: A tuple from the list of new files generated by mark_files().
+    :return: 1 for the file that was copied, or None if there was an error.
+    """
+    output_path = file_tuple[2]
+    try:
+        util.fast_copy(file_tuple[0], output_path)
+        log.log("NEW - " + output_path)
+    except PermissionError:
+        # Write the full error to the log file and record that an error occurred
+        log.log_exception(output_path, "CREATING")
+        return None
+    return 1
+
+
+def copy_changed_file(file_tuple):
+    """
+    Overwrite a file in the backup that has changed. This is run on the threads used by process_files().
+    :param file_tuple: A tuple from the list of changed files generated by mark_files().
+    :return: 1 for the file that was updated, or None if there was an error.
+    """
+    output_path = file_tuple[2]
+    try:
+        # Large files that are the same size as their backup likely only changed in a few places
+        if file_tuple[1] >= DELTA_COPY_MIN_SIZE and file_tuple[1] == file_tuple[3]:
+            util.delta_copy(file_tuple[0], output_path)
+        else:
+            util.fast_copy(file_tuple[0], output_path)
+        log.log("UPDATED - " + output_path)
+    except PermissionError:
+        # Write the full error to the log file and record that an error occurred
+        log.log_exception(output_path, "UPDATING")
+        return None
+    return 1
 
 
 @observable
@@ -466,8 +680,8 @@ def reset_globals():
     global TOTAL_SIZE_PROCESSED
     global BACKUP_PROGRESS
     global ERROR
-    global ACTIVE_THREADS
-    global THREAD_START_DEPTH
+    global TOTAL_SIZE_NEW
+    global TOTAL_SIZE_REMOVED
     NUM_FILES_PROCESSED = 0
     NUM_FILES_MARKED = 0
     NUM_FILES_MODIFIED = 0
@@ -477,17 +691,8 @@ def reset_globals():
     TOTAL_SIZE_PROCESSED = 0
     BACKUP_PROGRESS = 0
     ERROR = ""
-    ACTIVE_THREADS = 0
-    THREAD_START_DEPTH = -1
-
-
-@observable
-def increment_processed():
-    """
-    Increment the global variable for tracking the number of files processed.
-    """
-    global NUM_FILES_PROCESSED
-    NUM_FILES_PROCESSED += 1
+    TOTAL_SIZE_NEW = 0
+    TOTAL_SIZE_REMOVED = 0
 
 
 @observable
@@ -499,52 +704,6 @@ def set_num_marked(num_marked):
     NUM_FILES_MARKED = num_marked
 
 
-@observable
-def increment_modified():
-    """
-    Increment the global variable for tracking the number of files modified.
-    """
-    global NUM_FILES_MODIFIED
-    NUM_FILES_MODIFIED += 1
-
-
-@observable
-def increment_new():
-    """
-    Increment the global variable for tracking the number of new files copied.
-    """
-    global NUM_FILES_NEW
-    NUM_FILES_NEW += 1
-
-
-@observable
-def increment_deleted():
-    """
-    Increment the global variable for tracking the number of files deleted.
-    """
-    global NUM_FILES_DELETED
-    NUM_FILES_DELETED += 1
-
-
-@observable
-def increment_error():
-    """
-    Increment the global variable for tracking the number of errors that occurred during the backup.
-    """
-    global NUM_FILES_ERROR
-    NUM_FILES_ERROR += 1
-
-
-@observable
-def increment_size(size):
-    """
-    Increment the global variable for tracking the total size of files processed.
-    :param size: The number of bytes to increment by.
-    """
-    global TOTAL_SIZE_PROCESSED
-    TOTAL_SIZE_PROCESSED += size
-
-
 @observable
 def reset_backup_number():
     """
@@ -566,12 +725,13 @@ def increment_backup_number():
 
 
 @observable
-def increment_backup_progress():
+def increment_backup_progress(amount=1):
     """
     Increment the global variable for tracking the number of files that have been copied, deleted, or modified so far.
+    :param amount: The number to increment by. 1 by default.
     """
     global BACKUP_PROGRESS
-    BACKUP_PROGRESS += 1
+    BACKUP_PROGRESS += amount
 
 
 @observable
@@ -595,11 +755,12 @@ def set_error(error):
     ERROR = error
 
 
-def mark_file_processed(file_size=0, modified=False, is_new=False, error=False, deleted=False):
+def mark_file_processed(counts, file_size=0, modified=False, is_new=False, error=False, deleted=False):
     """
-    Should be called when a file has been processed and backed up. This will increment the relevant
-    variables that track how many files have been processed. If deleted is set to true, the size and number
-    of files processed will not be incremented.
+    Should be called when a file has been processed during file preparation. This will increment the relevant
+    values in the given counts that track how many files have been processed. If deleted is set to true, the size
+    and number of files processed will not be incremented.
+    :param counts: The BackupCounters to count this file in.
     :param file_size: The size of the file that was processed. 0 by default.
     :param modified: True if the file was already in the backup, and has just been changed. False by default.
     :param is_new: True if the file was not in the backup previously and was just copied over. False by default.
@@ -607,16 +768,42 @@ def mark_file_processed(file_size=0, modified=False, is_new=False, error=False,
     :param deleted: True to process a deleted file. False by default. This will not touch other fields.
     """
     if not deleted:
-        increment_processed()
-        increment_size(file_size)
+        counts.processed += 1
+        counts.size += file_size
     if modified:
-        increment_modified()
+        counts.modified += 1
     if is_new:
-        increment_new()
+        counts.new += 1
+        counts.new_size += file_size
     if error:
-        increment_error()
+        counts.error += 1
     if deleted:
-        increment_deleted()
+        counts.deleted += 1
+
+
+@observable
+def add_file_counts(counts):
+    """
+    Add the counts of files found during file preparation to the global variables that track them. Every variable
+    is updated at once, so observers are only notified once for all of them.
+    :param counts: The BackupCounters to add.
+    """
+    global NUM_FILES_PROCESSED
+    global NUM_FILES_MODIFIED
+    global NUM_FILES_NEW
+    global NUM_FILES_ERROR
+    global NUM_FILES_DELETED
+    global TOTAL_SIZE_PROCESSED
+    global TOTAL_SIZE_NEW
+    global TOTAL_SIZE_REMOVED
+    NUM_FILES_PROCESSED += counts.processed
+    NUM_FILES_MODIFIED += counts.modified
+    NUM_FILES_NEW += counts.new
+    NUM_FILES_ERROR += counts.error
+    NUM_FILES_DELETED += counts.deleted
+    TOTAL_SIZE_PROCESSED += counts.size
+    TOTAL_SIZE_NEW += counts.new_size
+    TOTAL_SIZE_REMOVED += counts.removed_size
 
 
 def create_backup_text_file(backup_base_folder):
@@ -627,6 +814,28 @@ def create_backup_text_file(backup_base_folder):
     """
     current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     file_path = os.path.join(backup_base_folder, CONFIRMATION_FILENAME)
-    text_file = open(file_path, "w")
-    text_file.write("This backup was completed on " + current_time)
-    text_file.close()
+    file_contents = ("This backup was completed on " + current_time).encode()
+
+    # Write the file straight to disk, so the backup can't be shown as complete before it really is
+    file_descriptor = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_DSYNC", 0), 0o644)
+    try:
+        bytes_written = 0
+        while bytes_written < len(file_contents):
+            bytes_written += os.write(file_descriptor, file_contents[bytes_written:])
+        os.fsync(file_descriptor)
+    finally:
+        os.close(file_descriptor)
+
+    # Where directories can be opened, also flush the folder so the file itself is sure to exist after a crash.
+    # Some file systems and network drives don't allow this, which doesn't make the backup any less complete.
+    if hasattr(os, "O_DIRECTORY"):
+        try:
+            folder_descriptor = os.open(backup_base_folder, os.O_RDONLY | os.O_DIRECTORY)
+        except OSError:
+            return
+        try:
+            os.fsync(folder_descriptor)
+        except OSError:
+            pass
+        finally:
+            os.close(folder_descriptor)
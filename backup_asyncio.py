@@ -7,7 +7,6 @@ interface for the program.
 
 
 import threading
-import asyncio
 import queue
 import backup
 from observer import observer
@@ -15,7 +14,7 @@ from observer import observer
 
 class BackupThread(threading.Thread):
     """
-    A special-purpose asyncio thread for running the backup process concurrently with something else. While the
+    A special-purpose thread for running the backup process concurrently with something else. While the
     thread is running, a queue is kept and constantly updated with information from the backup process about
     number of files processed, the current status, etc. Processes using this thread can check the queue at set
     intervals to keep things like a UI updated alongside the backup.
@@ -26,7 +25,6 @@ class BackupThread(threading.Thread):
         Create the thread before running it. This accepts specific arguments needed while it runs.
         :param config: A configuration of files and folders to backup.
         """
-        self.loop = asyncio.get_event_loop()
         self.progress_queue = queue.Queue()
         self.config = config
         self.error_flag = False
@@ -42,35 +40,15 @@ class BackupThread(threading.Thread):
         def update_backup_number(backup_thread):
             backup_thread.progress_queue.put(("backup_number", backup.BACKUP_NUMBER))
 
-        @observer(backup.increment_processed, self)
+        @observer(backup.add_file_counts, self)
         @observer(backup.reset_globals, self)
-        def update_processed(backup_thread):
-            backup_thread.progress_queue.put(("processed", backup.NUM_FILES_PROCESSED))
-
-        @observer(backup.increment_modified, self)
-        @observer(backup.reset_globals, self)
-        def update_modified(backup_thread):
-            backup_thread.progress_queue.put(("modified", backup.NUM_FILES_MODIFIED))
-
-        @observer(backup.increment_new, self)
-        @observer(backup.reset_globals, self)
-        def update_new(backup_thread):
-            backup_thread.progress_queue.put(("new", backup.NUM_FILES_NEW))
-
-        @observer(backup.increment_deleted, self)
-        @observer(backup.reset_globals, self)
-        def update_deleted(backup_thread):
-            backup_thread.progress_queue.put(("deleted", backup.NUM_FILES_DELETED))
-
-        @observer(backup.increment_error, self)
-        @observer(backup.reset_globals, self)
-        def update_error(backup_thread):
-            backup_thread.progress_queue.put(("error", backup.NUM_FILES_ERROR))
-
-        @observer(backup.increment_size, self)
-        @observer(backup.reset_globals, self)
-        def update_size(backup_thread):
-            backup_thread.progress_queue.put(("size", backup.TOTAL_SIZE_PROCESSED))
+        def update_file_counts(backup_thread):
+            backup_thread.progress_queue.put(("counts", {"processed": backup.NUM_FILES_PROCESSED,
+                                                         "modified": backup.NUM_FILES_MODIFIED,
+                                                         "new": backup.NUM_FILES_NEW,
+                                                         "deleted": backup.NUM_FILES_DELETED,
+                                                         "error": backup.NUM_FILES_ERROR,
+                                                         "size": backup.TOTAL_SIZE_PROCESSED}))
 
         @observer(backup.increment_backup_progress, self)
         @observer(backup.reset_globals, self)
@@ -92,10 +70,5 @@ class BackupThread(threading.Thread):
             backup_thread.error_flag = True
             backup_thread.progress_queue.put(("display_error", backup.ERROR))
 
-        asyncio.run(asyncio.wait([self.run_backup()]))
-
-    async def run_backup(self):
-        """
-        Start the run_backup() asyncio task.
-        """
+        # The backup runs directly on this thread, it never waits on anything else that an event loop could run
         backup.run_backup(self.config)
@@ -7,6 +7,7 @@ their destinations.
 
 import os
 import pickle
+import functools
 import util
 import entry
 import copy
@@ -45,12 +46,28 @@ class Configuration:
     has one) as well as a list of Entry objects.
     """
 
+    __slots__ = ("_name", "_entries", "_deep_compare")
+
     def __init__(self):
         """
         Create the Configuration object.
         """
         self._name = None
         self._entries = []
+        self._deep_compare = True
+
+    def __setstate__(self, state):
+        """
+        Restore a configuration that was saved with pickle. Configurations saved before this class used slots were
+        saved with a dictionary of attributes rather than slot values, and anything missing from an older
+        configuration is given its default value.
+        :param state: The saved state, either a dictionary of attributes or a tuple holding one in its second value.
+        """
+        if isinstance(state, tuple):
+            state = state[1]
+        self._name = state.get("_name")
+        self._entries = state.get("_entries", [])
+        self._deep_compare = state.get("_deep_compare", True)
 
     @property
     def name(self):
@@ -68,6 +85,24 @@ class Configuration:
         """
         self._name = new_name
 
+    @property
+    def deep_compare(self):
+        """
+        Whether backups using this configuration compare the contents of files to check if they've changed.
+        When this is off, files are only checked by their size and last modified time.
+        :return: True if file contents are compared, false otherwise. This is true by default, and configurations
+                 saved before this existed are treated as true.
+        """
+        return self._deep_compare
+
+    @deep_compare.setter
+    def deep_compare(self, new_deep_compare):
+        """
+        Set whether backups using this configuration compare the contents of files.
+        :param new_deep_compare: True to compare file contents, false to only compare size and modified time.
+        """
+        self._deep_compare = new_deep_compare
+
     @property
     def entries(self):
         """
@@ -105,7 +140,7 @@ class Configuration:
         :param input_path: The path to a folder or file to backup.
         :return: True if it already exists, false otherwise.
         """
-        return input_path in self.get_all_entry_inputs()
+        return any(config_entry.input == input_path for config_entry in self._entries)
 
     def all_entries_have_outputs(self):
         """
@@ -158,10 +193,8 @@ class Configuration:
         """
         entry_inputs = self.get_all_entry_inputs()
         entry_outputs = self.get_all_entry_outputs()
-        return_str = ""
-        for entry_idx in range(len(entry_inputs)):
-            return_str += "{}: {} --> {}\n".format(entry_idx+1, entry_inputs[entry_idx], entry_outputs[entry_idx])
-        return return_str.strip()
+        return "\n".join("{}: {} --> {}".format(entry_idx+1, entry_inputs[entry_idx], entry_outputs[entry_idx])
+                         for entry_idx in range(len(entry_inputs))).strip()
 
     def num_entries(self):
         """
@@ -193,7 +226,7 @@ class Configuration:
             for destination in destination_list:
                 output_absolute = os.path.join(destination, '')
                 input_absolute = os.path.join(config_entry.input, '')
-                if os.path.commonprefix([output_absolute, input_absolute]) == input_absolute:
+                if output_absolute.startswith(input_absolute):
                     return True
         return False
 
@@ -207,7 +240,7 @@ class Configuration:
     def equals(self, other_config):
         """
         Check if this configuration is equal to another. For them to be equal, the names need to be
-        equal, and every Entry needs to be equal.
+        equal, they need to compare files the same way, and every Entry needs to be equal.
         :param other_config: A configuration to check if it's equal to this one.
         :return: True if they are equal, false otherwise.
         """
@@ -219,6 +252,9 @@ class Configuration:
         # They must have the same number of entries
         if not len(self._entries) == len(other_config._entries):
             return False
+        # They must compare files the same way
+        if not self.deep_compare == other_config.deep_compare:
+            return False
         # Every entry must be equal
         for entry_idx in range(1, len(self._entries)+1):
             if not self.get_entry(entry_idx).equals(other_config.get_entry(entry_idx)):
@@ -226,6 +262,16 @@ class Configuration:
         return True
 
 
+@functools.lru_cache(maxsize=None)
+def config_directory():
+    """
+    Get the directory configurations are saved to. This is only built once, since the working directory
+    doesn't change while the program is running.
+    :return: The absolute path to the saved configuration directory.
+    """
+    return os.path.join(util.working_directory(), CONFIG_DIRECTORY)
+
+
 def config_exists(config_name):
     """
     Checks the saved configuration folder to see if a configuration with a given name exists.
@@ -235,7 +281,7 @@ def config_exists(config_name):
     if config_name is None:
         return False
     file_name = config_name + ".dat"
-    file_path = os.path.join(util.working_directory(), CONFIG_DIRECTORY, file_name)
+    file_path = os.path.join(config_directory(), file_name)
     return os.path.exists(file_path)
 
 
@@ -265,14 +311,12 @@ def save_config(config, config_name):
     :param config_name: The name to give the configuration file.
     """
     file_name = config_name + ".dat"
-    file_path = os.path.join(util.working_directory(), CONFIG_DIRECTORY, file_name)
-    if not os.path.exists(os.path.join(util.working_directory(), CONFIG_DIRECTORY)):
-        os.makedirs(os.path.join(util.working_directory(), CONFIG_DIRECTORY), exist_ok=True)
-    if os.path.exists(file_path):
-        os.remove(file_path)
-    config_file = open(file_path, "wb")
-    pickle.dump(config, config_file)
-    config_file.close()
+    file_path = os.path.join(config_directory(), file_name)
+    os.makedirs(config_directory(), exist_ok=True)
+    # Pickle to bytes first so the file is written in one call, opening it replaces anything saved with this name
+    config_data = pickle.dumps(config, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(file_path, "wb") as config_file:
+        config_file.write(config_data)
     print("{} was successfully saved to the {} directory.".format(file_name, CONFIG_DIRECTORY))
 
 
@@ -282,12 +326,15 @@ def saved_config_display_string():
     of each valid configuration.
     :return: A string containing the names of all saved configurations.
     """
-    if not os.path.exists(os.path.join(util.working_directory(), CONFIG_DIRECTORY)):
-        return ""
     list_str = ""
-    for filename in os.listdir(os.path.join(util.working_directory(), CONFIG_DIRECTORY)):
-        if filename.endswith(".dat"):
-            list_str += os.path.splitext(filename)[0] + "\n"
+    try:
+        with os.scandir(config_directory()) as scanner:
+            for dir_entry in scanner:
+                if dir_entry.name.endswith(".dat") and dir_entry.is_file():
+                    list_str += os.path.splitext(dir_entry.name)[0] + "\n"
+    except FileNotFoundError:
+        # Nothing has been saved yet if the directory doesn't exist
+        return ""
     return list_str
 
 
@@ -301,11 +348,9 @@ def load_config(config_name):
     if config_name is None:
         return None
     file_name = config_name + ".dat"
-    file_path = os.path.join(util.working_directory(), CONFIG_DIRECTORY, file_name)
-    config_file = open(file_path, "rb")
-    config = pickle.load(config_file)
-    config_file.close()
-    return config
+    file_path = os.path.join(config_directory(), file_name)
+    with open(file_path, "rb") as config_file:
+        return pickle.loads(config_file.read())
 
 
 def delete_config(config_name):
@@ -317,7 +362,7 @@ def delete_config(config_name):
     if config_name is None:
         return
     file_name = config_name + ".dat"
-    file_path = os.path.join(util.working_directory(), CONFIG_DIRECTORY, file_name)
+    file_path = os.path.join(config_directory(), file_name)
     if os.path.exists(file_path):
         os.remove(file_path)
 
@@ -332,7 +377,7 @@ def append_input_to_config(config, input_string):
     :param input_string: An absolute file path to a valid file or directory.
     """
     # Return false if this input is not a valid directory/file.
-    if not os.path.isdir(input_string) and not os.path.isfile(input_string):
+    if not util.is_file_or_directory(input_string):
         raise InvalidPathException("\"" + input_string + "\" is not a valid directory or file.")
 
     # Add the string as a new entry and check for cyclic entries, remove it if it creates one
@@ -365,17 +410,20 @@ def append_output_to_config(config, entry_number, output_string):
     # Return false if the output isn't a valid directory or it's a sub-path of the input.
     if not os.path.isdir(output_string):
         raise InvalidPathException("\"" + output_string + "\" is not a valid directory.")
+    # The output's real path is the same for every entry, so it's only resolved once
+    output_real_path = os.path.realpath(output_string)
+    output_absolute = os.path.join(output_real_path, '')
+    # Inputs are stored as real paths when they're added, so they don't need to be resolved again
     for current_entry_number in entry_numbers:
-        output_absolute = os.path.join(os.path.realpath(output_string), '')
-        input_absolute = os.path.join(os.path.realpath(config.get_entry(current_entry_number).input), '')
-        if os.path.commonprefix([output_absolute, input_absolute]) == input_absolute:
+        input_absolute = os.path.join(config.get_entry(current_entry_number).input, '')
+        if output_absolute.startswith(input_absolute):
             raise SubPathException("New output \"" + output_absolute + "\" is a sub-path of the input \"" +
                                    input_absolute + "\".")
 
     # Copy the configuration and attempt to add the new output, return false if it creates cyclic entries
     copy_config = copy.deepcopy(config)
     for current_entry_number in entry_numbers:
-        copy_config.get_entry(current_entry_number).new_destination(os.path.realpath(output_string))
+        copy_config.get_entry(current_entry_number).new_destination(output_real_path)
     if copy_config.check_for_cyclic_entries():
         raise CyclicEntryException("Adding \"" + output_string + "\" as an output to " +
                                    ("entry " + str(entry_number) if not entry_number == 0 else "all entries") +
@@ -383,7 +431,7 @@ def append_output_to_config(config, entry_number, output_string):
 
     # Add the string as a new output for this entry.
     for current_entry_number in entry_numbers:
-        config.get_entry(current_entry_number).new_destination(os.path.realpath(output_string))
+        config.get_entry(current_entry_number).new_destination(output_real_path)
 
 
 def edit_input_in_config(config, entry_number, new_input):
@@ -396,14 +444,15 @@ def edit_input_in_config(config, entry_number, new_input):
     :param new_input: The new input path.
     """
     # Return false if this input is not a valid directory/file.
-    if not os.path.isdir(new_input) and not os.path.isfile(new_input):
+    if not util.is_file_or_directory(new_input):
         raise InvalidPathException("\"" + new_input + "\" is not a valid directory or file.")
 
     # Ensure the input can't be changed to that one of its outputs becomes a sub-folder.
+    # Outputs are stored as real paths when they're added, so only the new input needs to be resolved.
+    input_absolute = os.path.join(os.path.realpath(new_input), '')
     for destination in config.get_entry(entry_number).outputs:
-        output_absolute = os.path.join(os.path.realpath(destination), '')
-        input_absolute = os.path.join(os.path.realpath(new_input), '')
-        if os.path.commonprefix([output_absolute, input_absolute]) == input_absolute:
+        output_absolute = os.path.join(destination, '')
+        if output_absolute.startswith(input_absolute):
             raise SubPathException("Changing the input to \"" + input_absolute + "\" makes output \"" +
                                    output_absolute + "\" become a sub-path of the new input.")
 
@@ -430,8 +479,8 @@ def edit_destination_in_config(config_entry, destination_number, new_output, con
     if not os.path.isdir(new_output):
         raise InvalidPathException("\"" + new_output + "\" is not a valid directory.")
     output_absolute = os.path.join(os.path.realpath(new_output), '')
-    input_absolute = os.path.join(os.path.realpath(config_entry.input), '')
-    if os.path.commonprefix([output_absolute, input_absolute]) == input_absolute:
+    input_absolute = os.path.join(config_entry.input, '')
+    if output_absolute.startswith(input_absolute):
         raise SubPathException("New output \"" + output_absolute + "\" is a sub-path of the input \"" +
                                input_absolute + "\".")
 
@@ -444,11 +493,13 @@ def edit_destination_in_config(config_entry, destination_number, new_output, con
                                    "\" creates a cyclic entry.")
 
 
-def config_display_string(config, show_exclusions=False):
+def config_display_string(config, show_exclusions=False, show_sizes=True):
     """
     Builds a string that contains all relevant information about a given configuration.
     :param config: The configuration object to display information about.
     :param show_exclusions: True if detailed exclusion information should be shown. False by default.
+    :param show_sizes: True if the size of each input should be shown, which requires going through every file
+                       in it. True by default.
     :return: A string containing formatted information about the configuration.
     """
     # Display this message if there is nothing in the configuration yet
@@ -457,35 +508,40 @@ def config_display_string(config, show_exclusions=False):
 
     # Header: show the configuration name if it exists
     if config.name is None:
-        return_str = "CURRENT CONFIGURATION         \n"
+        parts = ["CURRENT CONFIGURATION         \n"]
     else:
-        return_str = "CURRENT CONFIGURATION ({})    \n".format(config.name)
+        parts = ["CURRENT CONFIGURATION ({})    \n".format(config.name)]
 
     # Loop through every entry and show information about each
     entry_number = 1
     for input_str, outputs_list in config.get_zipped_entries():
         # Display the size of this entry's input
-        total_size, total_files = util.directory_size_with_exclusions(input_str, config, entry_number)
-        return_str += "\tBACKUP: {} ({}, {} files)".format(input_str, util.bytes_to_string(total_size, 2), total_files)
+        if show_sizes:
+            total_size, total_files = util.directory_size_with_exclusions(input_str, config, entry_number)
+            parts.append("\tBACKUP: {} ({}, {} files)".format(input_str, util.bytes_to_string(total_size, 2),
+                                                              total_files))
+        else:
+            parts.append("\tBACKUP: {}".format(input_str))
 
         # If this entry has exclusions, show them
         if config.get_entry(entry_number).num_exclusions() > 0:
             # If show_exclusions is true, show all information, otherwise just show that exclusions exist here
             if show_exclusions:
-                return_str += "\n\t\tEXCLUSIONS:\n"
+                parts.append("\n\t\tEXCLUSIONS:\n")
                 for exclusion in config.get_entry(entry_number).exclusions:
-                    return_str += "\t\t\t{}\n".format(exclusion.to_string())
+                    parts.append("\t\t\t{}\n".format(exclusion.to_string()))
                     if exclusion.has_limitations():
                         for limitation in exclusion.limitations:
-                            return_str += "\t\t\t\tLimit to {}\n".format(limitation.to_string(
-                                config.get_entry(entry_number).input))
+                            parts.append("\t\t\t\tLimit to {}\n".format(limitation.to_string(
+                                config.get_entry(entry_number).input)))
             else:
-                return_str += " [Contains exclusions]\n"
+                parts.append(" [Contains exclusions]\n")
         else:
-            return_str += "\n"
+            parts.append("\n")
 
         # Display every output path below the previously displayed input
         for output_str in outputs_list:
-            return_str += "\t\tCOPY TO: {}\n".format(output_str)
+            parts.append("\t\tCOPY TO: {}\n".format(output_str))
         entry_number += 1
-    return return_str.strip()
+    # Every part is joined at once rather than building the string up a piece at a time
+    return "".join(parts).strip()
@@ -6,6 +6,7 @@ file, and changes only need to be made here to add additional types of exclusion
 """
 
 import os
+import functools
 from datetime import datetime
 from os.path import realpath as rpath
 import limitations
@@ -345,10 +346,18 @@ def get_exclusion_type(exclusion):
     :param exclusion: The exclusion to find the type for.
     :return: The exclusion type if found, None otherwise.
     """
-    for exclusion_type in EXCLUSION_TYPES:
-        if exclusion_type.code == exclusion.code:
-            return exclusion_type
-    return None
+    return EXCLUSION_TYPES_BY_CODE.get(exclusion.code)
+
+
+@functools.lru_cache(maxsize=None)
+def date_timestamp(date_str):
+    """
+    Get the timestamp of the start of a date entered for an exclusion. Each date is only parsed once, no matter how
+    many files it's checked against.
+    :param date_str: A date string in the format MM/DD/YYYY.
+    :return: The timestamp of midnight local time on that date, as seconds since the epoch.
+    """
+    return datetime.strptime(date_str, "%m/%d/%Y").timestamp()
 
 
 def is_valid_exclusion_type(excl_type):
@@ -357,10 +366,7 @@ def is_valid_exclusion_type(excl_type):
     :param excl_type: A string to check.
     :return: True if the given string equals an exclusion type's code, false otherwise.
     """
-    for exclusion_type in EXCLUSION_TYPES:
-        if excl_type == exclusion_type.code:
-            return True
-    return False
+    return excl_type in EXCLUSION_TYPES_BY_CODE
 
 
 """
@@ -411,8 +417,8 @@ EXCLUSION_TYPES = [ExclusionType(code="startswith", menu_text="Starts with some
                                  ui_submit=lambda e: e.get()),
                    ExclusionType(code="before", menu_text="Files modified before a given date",
                                  input_text="Files modified before this date will be excluded (MM/DD/YYYY): ",
-                                 function=lambda excl, path: os.path.isfile(path) and datetime.strptime(
-                                     excl.data, "%m/%d/%Y") > datetime.fromtimestamp(os.path.getmtime(path)),
+                                 function=lambda excl, path: os.path.isfile(path) and date_timestamp(
+                                     excl.data) > os.path.getmtime(path),
                                  ui_input=lambda m: DateEntry(m, date_pattern="mm/dd/y"),
                                  ui_edit=lambda m, excl: DateEntry(
                                      m, date_pattern="mm/dd/y", year=parser.parse(excl.data).year,
@@ -420,10 +426,13 @@ EXCLUSION_TYPES = [ExclusionType(code="startswith", menu_text="Starts with some
                                  ui_submit=lambda e: e.get_date().strftime("%m/%d/%Y")),
                    ExclusionType(code="after", menu_text="Files modified after a given date",
                                  input_text="Files modified after this date will be excluded (MM/DD/YYYY): ",
-                                 function=lambda excl, path: os.path.isfile(path) and datetime.strptime(
-                                     excl.data, "%m/%d/%Y") < datetime.fromtimestamp(os.path.getmtime(path)),
+                                 function=lambda excl, path: os.path.isfile(path) and date_timestamp(
+                                     excl.data) < os.path.getmtime(path),
                                  ui_input=lambda m: DateEntry(m, date_pattern="mm/dd/y"),
                                  ui_edit=lambda m, excl: DateEntry(
                                      m, date_pattern="mm/dd/y", year=parser.parse(excl.data).year,
                                      month=parser.parse(excl.data).month, day=parser.parse(excl.data).day),
                                  ui_submit=lambda e: e.get_date().strftime("%m/%d/%Y"))]
+
+# Every exclusion type by its code, so the type of an exclusion can be looked up without searching the list
+EXCLUSION_TYPES_BY_CODE = {exclusion_type.code: exclusion_type for exclusion_type in EXCLUSION_TYPES}
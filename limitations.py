@@ -317,10 +317,7 @@ def get_limitation_type(limitation):
     :param limitation: The limitation to find the type for.
     :return: The limitation type if found, None otherwise.
     """
-    for limitation_type in LIMITATION_TYPES:
-        if limitation_type.code == limitation.code:
-            return limitation_type
-    return None
+    return LIMITATION_TYPES_BY_CODE.get(limitation.code)
 
 
 def is_valid_limitation_type(limit_type):
@@ -329,10 +326,7 @@ def is_valid_limitation_type(limit_type):
     :param limit_type: A string to check.
     :return: True if the given string equals an limitation type's code, false otherwise.
     """
-    for limitation_type in LIMITATION_TYPES:
-        if limit_type == limitation_type.code:
-            return True
-    return False
+    return limit_type in LIMITATION_TYPES_BY_CODE
 
 
 """
@@ -365,3 +359,6 @@ LIMITATION_TYPES = \
                           ui_input=lambda m: tk.Entry(m),
                           ui_edit=lambda m, limit: tk.Entry(m, textvariable=tk.StringVar(m, value=limit.data)),
                           ui_submit=lambda e: e.get())]
+
+# Every limitation type by its code, so the type of a limitation can be looked up without searching the list
+LIMITATION_TYPES_BY_CODE = {limitation_type.code: limitation_type for limitation_type in LIMITATION_TYPES}
@@ -9,6 +9,9 @@ from datetime import datetime
 import sys
 import traceback
 import os
+import queue
+import threading
+import time
 import util
 
 
@@ -16,6 +19,33 @@ import util
 LOG_FILE = None
 LOGS_DIRECTORY = "logs"
 
+# Log messages are buffered in memory and written to the file in large blocks rather than one at a time
+LOG_BUFFER_SIZE = 2 ** 20
+
+# The most time in seconds written messages can wait in the buffer before it's flushed to the file
+LOG_FLUSH_INTERVAL = 1
+
+# Messages are passed to a separate thread through this queue to be written, so logging never waits on the disk
+LOG_QUEUE = None
+LOG_THREAD = None
+
+# The most messages that can wait in the queue, past this logging waits for the log thread to catch up so messages
+# can't pile up in memory faster than they can be written
+LOG_QUEUE_SIZE = 10000
+
+# How many seconds logging waits at a time on a full queue or a flush before checking the log thread is still running
+LOG_WAIT_TIMEOUT = 1
+
+# The error that stopped the log thread from writing to the file, or None if it hasn't failed
+LOG_ERROR = None
+
+
+class LogWriteException(Exception):
+    """
+    Exception raised when logging after the log file could no longer be written to.
+    """
+    pass
+
 
 def logger(func):
     """
@@ -26,7 +56,16 @@ def logger(func):
     """
     def wrapper_logger(*args, **kwargs):
         begin_log()
-        return_value = func(*args, **kwargs)
+        try:
+            return_value = func(*args, **kwargs)
+        except BaseException:
+            # The log is always closed so its thread and file don't leak, but an error while closing it is only
+            # reported, so it doesn't replace the exception the function raised
+            try:
+                end_log()
+            except (LogWriteException, OSError, ValueError) as error:
+                print("Unable to finish writing the log file: {}".format(error))
+            raise
         end_log()
         return return_value
     return wrapper_logger
@@ -37,25 +76,41 @@ def begin_log():
     Open the log file to prepare for it to be written to. This will also write the first line
     of the log file. This should be called before using log() or end_log().
     """
-    global LOG_FILE
+    global LOG_FILE, LOG_QUEUE, LOG_THREAD, LOG_ERROR
     if not os.path.exists(os.path.join(util.working_directory(), LOGS_DIRECTORY)):
         os.makedirs(os.path.join(util.working_directory(), LOGS_DIRECTORY), exist_ok=True)
     current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     file_name = "log_backup_" + current_time + ".txt"
     file_path = os.path.join(util.working_directory(), LOGS_DIRECTORY, file_name)
-    LOG_FILE = open(file_path, "w")
+    LOG_FILE = open(file_path, "w", buffering=LOG_BUFFER_SIZE)
     LOG_FILE.write("Beginning backup log: " + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + "\n")
+    LOG_QUEUE = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    LOG_ERROR = None
+    LOG_THREAD = threading.Thread(target=write_log_messages, args=(LOG_FILE, LOG_QUEUE), daemon=True)
+    LOG_THREAD.start()
 
 
 def end_log():
     """
     Close the log file after writing an ending message to the file. This should only be called
     after begin_log(). To write more log messages after this is called, begin_log() must be
-    called again, which will start a new file.
+    called again, which will start a new file. If the log file could not be written to, a LogWriteException
+    is raised once the file is closed.
     """
-    global LOG_FILE
-    LOG_FILE.write("Ending backup log: " + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + "\n")
-    LOG_FILE.close()
+    # Let the log thread write everything still waiting in the queue and stop before the file is closed
+    LOG_QUEUE.put(None)
+    LOG_THREAD.join()
+    try:
+        if LOG_ERROR is None:
+            LOG_FILE.write("Ending backup log: " + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + "\n")
+    finally:
+        try:
+            LOG_FILE.close()
+        except (OSError, ValueError):
+            # A file that already failed to be written to can't write out its buffer either, but it's still closed
+            if LOG_ERROR is None:
+                raise
+    check_log_error()
 
 
 def log(log_str=""):
@@ -66,8 +121,7 @@ def log(log_str=""):
     can be used.
     :param log_str: The string to append to the log file.
     """
-    global LOG_FILE
-    LOG_FILE.write(str(log_str.encode('utf8')) + "\n")
+    queue_log_item(log_str)
 
 
 def log_print(log_str=""):
@@ -78,8 +132,7 @@ def log_print(log_str=""):
     :param log_str:
     :return:
     """
-    global LOG_FILE
-    LOG_FILE.write(str(log_str.encode('utf8')) + "\n")
+    queue_log_item(log_str)
     print(log_str)
 
 
@@ -89,10 +142,108 @@ def log_exception(error_file_path, action="ACCESSING"):
     :param error_file_path: The file or folder that caused the error.
     :param action: What was happening to that file to cause the error, such as "creating" or "deleting".
     """
-    log("\n" + '=' * 60 + "\nERROR {} {}".format(action, error_file_path))
     exc_type, exc_value, exc_traceback = sys.exc_info()
     exception_list = traceback.format_exception(exc_type, exc_value, exc_traceback)
     full_error_str = ""
     for item in exception_list:
         full_error_str += item
-    log(full_error_str + '=' * 60 + "\n")
\ No newline at end of file
+    # Both messages are queued together so an error from another thread can't be written between them
+    log("\n" + '=' * 60 + "\nERROR {} {}".format(action, error_file_path) + "\n" + full_error_str + '=' * 60 + "\n")
+
+
+def flush():
+    """
+    Wait until every message logged so far has been written to the log file, and the file's buffer has been
+    written out. The log file must be opened before using this function. This raises a LogWriteException if
+    the log file could not be written to.
+    """
+    flushed = threading.Event()
+    queue_log_item(flushed)
+    while not flushed.wait(LOG_WAIT_TIMEOUT):
+        if not LOG_THREAD.is_alive():
+            raise LogWriteException("The log thread stopped before the log file was flushed.")
+    check_log_error()
+
+
+def check_log_error():
+    """
+    Raise a LogWriteException if the log thread has failed to write to the log file.
+    """
+    if LOG_ERROR is not None:
+        raise LogWriteException("Unable to write to the log file: {}".format(LOG_ERROR)) from LOG_ERROR
+
+
+def queue_log_item(item):
+    """
+    Put a message or an Event in the queue for the log thread. If the queue is full, this waits for the log thread
+    to make room, checking that the thread is still running so logging can never wait forever. This raises a
+    LogWriteException if the log file could not be written to.
+    :param item: The message or Event to queue.
+    """
+    check_log_error()
+    while True:
+        try:
+            LOG_QUEUE.put(item, timeout=LOG_WAIT_TIMEOUT)
+            return
+        except queue.Full:
+            if not LOG_THREAD.is_alive():
+                raise LogWriteException("The log thread stopped while messages were waiting to be written.")
+
+
+def write_log_messages(log_file, message_queue):
+    """
+    Write messages from a queue to the log file until None is taken from the queue. This is run on its own thread
+    while the log file is open. Every message waiting in the queue is written at once, so messages logged close
+    together are written in a single block, and the file is flushed at least every LOG_FLUSH_INTERVAL seconds
+    while there's anything in its buffer so the log stays close to up to date. If writing to the file fails, the
+    error is saved in LOG_ERROR, and the thread keeps taking items from the queue without writing them until it's
+    told to stop, so nothing waiting on it is left waiting forever.
+    :param log_file: The open log file to write to.
+    :param message_queue: The queue messages are taken from. An Event in the queue will be set once everything
+                          before it is written and the file is flushed.
+    """
+    global LOG_ERROR
+    running = True
+    unflushed = False
+    last_flush_time = time.monotonic()
+    while running:
+        # Only wake up on a timer when there's something in the buffer that will need to be flushed
+        try:
+            if unflushed:
+                items = [message_queue.get(timeout=max(0, last_flush_time + LOG_FLUSH_INTERVAL - time.monotonic()))]
+            else:
+                items = [message_queue.get()]
+        except queue.Empty:
+            items = []
+        # Take everything else that's already waiting too
+        try:
+            while True:
+                items.append(message_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        lines = []
+        flushed_events = []
+        for item in items:
+            if item is None:
+                running = False
+            elif isinstance(item, threading.Event):
+                flushed_events.append(item)
+            else:
+                lines.append(str(item.encode('utf8')) + "\n")
+        # Once the file can't be written to, messages are dropped and only Events are handled
+        if LOG_ERROR is None:
+            try:
+                if len(lines) > 0:
+                    log_file.write("".join(lines))
+                    unflushed = True
+                if len(flushed_events) > 0 or (unflushed and
+                                               time.monotonic() - last_flush_time >= LOG_FLUSH_INTERVAL):
+                    log_file.flush()
+                    unflushed = False
+                    last_flush_time = time.monotonic()
+            except (OSError, ValueError) as error:
+                LOG_ERROR = error
+                unflushed = False
+        for flushed in flushed_events:
+            flushed.set()
\ No newline at end of file
@@ -584,6 +584,26 @@ def option_load(**kwargs):
     return {"config": configuration.load_config(config_name)}
 
 
+def option_compare(**kwargs):
+    """
+    The code run when the compare argument is given. This will set whether backups using the configuration
+    compare the contents of files that might have changed, or only their sizes and last modified times.
+    :param kwargs: A dictionary of arguments. This expects 'config' as a valid configuration, 'opts' as
+                   a list of options created by getopt, and 'iterator' as the current iterator being used.
+    """
+    config = kwargs["config"]
+    opts = kwargs["opts"]
+    iterator = kwargs["iterator"]
+    compare_data = opts[iterator.current][1].lower()
+    if compare_data == "on":
+        config.deep_compare = True
+    elif compare_data == "off":
+        config.deep_compare = False
+    else:
+        print("\nERROR: \"" + opts[iterator.current][1] + "\" is not valid, file comparison must be \"on\" or " +
+              "\"off\".")
+
+
 def option_backup(**kwargs):
     """
     The code run when the backup argument is given. This will pass the configuration to the backup module
@@ -671,6 +691,10 @@ ARGUMENT_FLAGS = [Argument("i", "input_path", "A path that will be a source for
                   Argument("l", "config_name", "The name of a saved configuration to load.", option_load),
                   ArgumentWrapper("c", "config_name", "Load this config at the start and save it at the end.",
                                   option_load, option_save),
+                  Argument("k", "on_or_off", "Turn comparing the contents of files during backups \"on\" or " +
+                           "\"off\". It is on by default. When it's off, files are only checked for changes by " +
+                           "their size and last modified time, which is faster but can miss some changes.",
+                           option_compare),
                   ArgumentEmpty("b", "Run a backup on the current configuration.", option_backup),
                   ArgumentEmpty("p", "Print the current configuration.", option_print),
                   ArgumentEmpty("q", "Print all valid exclusion types.", option_print_ext_types),
@@ -493,6 +493,20 @@ def menu_option_load(config, config_list):
     return config
 
 
+def menu_option_compare(config):
+    """
+    The code that is run when the menu option for changing how files are compared is selected. This switches
+    the configuration between comparing the contents of files that might have changed, and only comparing their
+    sizes and last modified times.
+    :param config: The current backup configuration.
+    """
+    config.deep_compare = not config.deep_compare
+    if config.deep_compare:
+        print("Backups will now compare the contents of files that might have changed.")
+    else:
+        print("Backups will now only compare the sizes and last modified times of files.")
+
+
 def menu_option_backup(config):
     """
     The code that is run when the menu option for backing up the selected files is selected.
@@ -548,7 +562,9 @@ def main():
                                  "Load a backup configuration",
                                  "Backup your files",
                                  "Re-scan for available drives",
-                                 "Exit"])
+                                 "Exit",
+                                 ("Stop comparing file contents during backups" if config.deep_compare
+                                  else "Compare file contents during backups")])
         print()
 
         # Select a folder or file to backup
@@ -607,6 +623,9 @@ def main():
         # Exit
         elif user_input == 9:
             break
+        # Change how files are compared
+        elif user_input == 10:
+            menu_option_compare(config)
 
 
 if __name__ == "__main__":
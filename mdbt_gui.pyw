@@ -190,6 +190,10 @@ class Application:
         self.menu_edit.add_command(label="Delete all limitations on the current exclusion",
                                    command=self.delete_exclusion_limitations)
         self.menu_edit.add_separator()
+        self.deep_compare_var = tk.BooleanVar(value=self.config.deep_compare)
+        self.menu_edit.add_checkbutton(label="Compare file contents during backups", variable=self.deep_compare_var,
+                                       command=self.toggle_deep_compare)
+        self.menu_edit.add_separator()
         self.menu_edit.add_command(label="Refresh fileviews", command=self.refresh_fileviews)
         self.menu_edit.add_separator()
         self.menu_edit.add_command(label="Clear configuration", command=self.clear_configuration)
@@ -440,6 +444,7 @@ class Application:
         # If an option was chosen, load it in
         if self.config_name is not None:
             self.config = configuration.load_config(self.config_name)
+            self.deep_compare_var.set(self.config.deep_compare)
             self.update_config_name_label()
             self.update_output_label()
             self.reset_entry_buttons()
@@ -453,11 +458,21 @@ class Application:
         a new empty one, as well as reset all fields in the UI.
         """
         self.config = configuration.Configuration()
+        self.deep_compare_var.set(self.config.deep_compare)
         self.update_config_name_label()
         self.update_output_label()
         self.reset_entry_buttons()
         self.set_fields_to_entry(1)
 
+    def toggle_deep_compare(self):
+        """
+        Functionality for the compare file contents option. This sets whether backups using the current
+        configuration compare the contents of files that might have changed, or only their sizes and last
+        modified times, to match the option's check mark.
+        """
+        self.config.deep_compare = self.deep_compare_var.get()
+        self.update_config_name_label()
+
     def reset_entry_buttons(self):
         """
         Resets the entry button scrollable frame. This will clear the widget, then re-add the "New Entry"
@@ -1005,26 +1020,23 @@ class Application:
                 self.backup_window.current_backup = data
                 if 0 <= self.backup_window.current_backup < self.num_backups:
                     self.backup_tabs.select(self.backup_window.current_backup)
-            elif key == "processed":
-                if data == 0:
+            elif key == "counts":
+                # The counts of files found are all sent together whenever any of them change
+                if data["processed"] == 0:
                     label_text = "Inactive"
                 else:
-                    label_text = "{} files found".format(data)
+                    label_text = "{} files found".format(data["processed"])
                 self.backup_status_labels[self.backup_window.current_backup].configure(text=label_text)
-            elif key == "modified":
                 self.backup_labels_modified[self.backup_window.current_backup].configure(
-                    text="Modified: {}".format(data))
-            elif key == "new":
-                self.backup_labels_new[self.backup_window.current_backup].configure(text="New: {}".format(data))
-            elif key == "deleted":
+                    text="Modified: {}".format(data["modified"]))
+                self.backup_labels_new[self.backup_window.current_backup].configure(
+                    text="New: {}".format(data["new"]))
                 self.backup_labels_deleted[self.backup_window.current_backup].configure(
-                    text="Deleted: {}".format(data))
-            elif key == "error":
+                    text="Deleted: {}".format(data["deleted"]))
                 self.backup_labels_error[self.backup_window.current_backup].configure(
-                    text="Error: {}".format(data))
-            elif key == "size":
+                    text="Error: {}".format(data["error"]))
                 self.backup_labels_size[self.backup_window.current_backup].configure(
-                    text="{}".format(util.bytes_to_string(data, 2)))
+                    text="{}".format(util.bytes_to_string(data["size"], 2)))
             elif key == "progress":
                 self.backup_progress_bars[self.backup_window.current_backup]['value'] = data
             elif key == "status":
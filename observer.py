@@ -21,10 +21,12 @@ def observable(func):
     """
     def wrapper_observable(*args, **kwargs):
         return_value = func(*args, **kwargs)
-        if wrapper_observable in OBSERVER_DICT.keys():
-            for observing_func in OBSERVER_DICT[wrapper_observable]:
-                observing_func(*ARGS_DICT[(observing_func, wrapper_observable)][0],
-                               **ARGS_DICT[(observing_func, wrapper_observable)][1])
+        # Most functions have no observers when running without the GUI, so only a single lookup is done for them
+        observing_funcs = OBSERVER_DICT.get(wrapper_observable)
+        if observing_funcs:
+            for observing_func in observing_funcs:
+                observer_args, observer_kwargs = ARGS_DICT[(observing_func, wrapper_observable)]
+                observing_func(*observer_args, **observer_kwargs)
         return return_value
     return wrapper_observable
 
@@ -7,12 +7,71 @@ Additional utility functions used by the backup tool.
 import os
 import string
 import shutil
-import filecmp
 import stat
+import errno
+import collections
+import threading
+import sys
+import ctypes
+try:
+    import fcntl
+except ImportError:
+    # This module only exists on Unix, files are never cloned without it
+    fcntl = None
 
 
 APP_VERSION = "1.0.1"
 
+# The size of each block read from two files when comparing their contents
+COMPARE_BLOCK_SIZE = 2 ** 20
+
+# The size of the buffer used when a file has to be copied by reading and writing it in blocks
+COPY_BUFFER_SIZE = 2 ** 20
+
+# Buffers kept by each thread to read files into, so they can be reused for every file instead of made again
+THREAD_BUFFERS = threading.local()
+
+# Files at least this large have their space on disk reserved before they're copied
+PREALLOCATE_MIN_SIZE = 2 ** 20
+
+# The size of the blocks compared and rewritten when updating a file in place
+DELTA_BLOCK_SIZE = 4 * (2 ** 10)
+
+# Errors raised by the operating system's copy functions when they can't be used for a given pair of files
+COPY_UNSUPPORTED_ERRORS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP,
+                           errno.EBADF, errno.ENOTSOCK)
+
+# The ioctl request that clones one file's contents into another on Linux copy-on-write filesystems like Btrfs and
+# XFS, so they share the same data on disk until either is changed
+FICLONE = 0x40049409
+
+# True if files can be cloned instead of copied on this system, when the filesystem supports it
+CLONE_SUPPORTED = fcntl is not None and sys.platform.startswith("linux")
+
+# True if os.sendfile() can copy between two files from their current positions, which only Linux allows. Other
+# systems that have it need an explicit offset and can only send files to sockets.
+SENDFILE_SUPPORTED = hasattr(os, "sendfile") and sys.platform.startswith("linux")
+
+# Errors raised when trying to clone a file that can't be cloned, such as when it's on a different filesystem
+CLONE_UNSUPPORTED_ERRORS = COPY_UNSUPPORTED_ERRORS + (errno.ENOTTY, errno.EPERM)
+
+# Hints given to the operating system about how a file being copied will be read, or None where they aren't supported
+FADVISE_SEQUENTIAL = getattr(os, "POSIX_FADV_SEQUENTIAL", None)
+FADVISE_DONTNEED = getattr(os, "POSIX_FADV_DONTNEED", None)
+
+# Flag for opening a file without updating its last accessed time, or 0 where it isn't supported
+NO_ATIME_FLAG = getattr(os, "O_NOATIME", 0)
+
+# The Linux fallocate() function, or None where it isn't available. This is used instead of os.posix_fallocate(),
+# which on filesystems that can't reserve space, like FAT and exFAT, falls back to writing out every block of the file
+try:
+    LINUX_FALLOCATE = ctypes.CDLL(None, use_errno=True).fallocate64 if sys.platform.startswith("linux") else None
+except (OSError, AttributeError):
+    LINUX_FALLOCATE = None
+if LINUX_FALLOCATE is not None:
+    LINUX_FALLOCATE.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64)
+    LINUX_FALLOCATE.restype = ctypes.c_int
+
 
 def get_drive_list():
     """
@@ -49,12 +108,31 @@ def directory_size(path):
     """
     total_size = 0
     total_files = 0
-    start_path = path
-    for path, dirs, files in os.walk(start_path):
-        for file in files:
-            next_file = os.path.join(path, file)
-            total_size += os.path.getsize(next_file)
-            total_files += 1
+    paths_to_check = collections.deque([path])
+    while len(paths_to_check) > 0:
+        current_path = paths_to_check.pop()
+        try:
+            scanner = os.scandir(current_path)
+        except OSError:
+            # Directories that can't be read are skipped, the same as os.walk() does
+            continue
+        with scanner:
+            for dir_entry in scanner:
+                # Walk into directories but not links to them, which are left alone like in os.walk()
+                if dir_entry.is_dir():
+                    if not dir_entry.is_symlink():
+                        paths_to_check.append(dir_entry.path)
+                    continue
+                # A file that can't be followed, like a link to something that no longer exists, is still
+                # counted using the size of the link itself
+                try:
+                    total_size += dir_entry.stat().st_size
+                except OSError:
+                    try:
+                        total_size += dir_entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        pass
+                total_files += 1
     return total_size, total_files
 
 
@@ -69,30 +147,40 @@ def directory_size_with_exclusions(path, config, input_number):
     :return: The number of bytes of storage files in that directory take up, followed by the total number
              of files in that directory, taking exclusions into account.
     """
-    # Don't continue down this path if it should be excluded
-    if config.get_entry(input_number).should_exclude(path):
-        return 0, 0
-    # If this is a file, add 1 to total files and its file size to the total file size
+    total_size, total_files = 0, 0
+    entry = config.get_entry(input_number)
+    if entry.should_exclude(path):
+        return total_size, total_files
+    # If the path itself is a file, it's the only one to count
     if os.path.isfile(path):
         return os.path.getsize(path), 1
-    # Otherwise, it's a directory, so recurse on each child of the directory
-    else:
-        total_size, total_files = 0, 0
+    paths_to_check = collections.deque([path])
+    while len(paths_to_check) > 0:
+        current_path = paths_to_check.pop()
         try:
-            for filename in os.listdir(path):
-                size, files = directory_size_with_exclusions(os.path.join(path, filename), config, input_number)
-                total_size += size
-                total_files += files
+            # Scan the directory once, the entries found already know if they're files and how large they are
+            with os.scandir(current_path) as scanner:
+                for dir_entry in scanner:
+                    # Don't continue down this path if it should be excluded
+                    if entry.should_exclude(dir_entry.path):
+                        continue
+                    # If this is a file, add 1 to total files and its file size to the total file size
+                    if dir_entry.is_file():
+                        total_size += dir_entry.stat().st_size
+                        total_files += 1
+                    # Otherwise, it's a directory, so check each child of the directory next
+                    else:
+                        paths_to_check.append(dir_entry.path)
         except FileNotFoundError as error:
             # Display a warning if long paths need to be enabled on Windows
-            if len(path) >= 260:
-                print("FileNotFoundError: Unable to access " + path)
+            if len(current_path) >= 260:
+                print("FileNotFoundError: Unable to access " + current_path)
                 print("This is likely because the file path is longer than 260 characters.")
                 print("If you are running this on Windows, set LongPathsEnabled to 1 in your registry.")
             else:
                 print(error)
             exit(1)
-        return total_size, total_files
+    return total_size, total_files
 
 
 def dir_empty(path):
@@ -144,35 +232,274 @@ def time_string(time_seconds):
         return "{:.3f} seconds".format(time_seconds)
 
 
-def file_compare(path1, path2, byte_limit=(50 * (2 ** 20)), mtime_delta=2):
+def get_thread_buffer(index, size):
     """
-    A modified version of filecmp.cmp() which will do much simpler checks to see if two files are equal if
-    the files are over a certain size, in order to avoid doing slow byte-by-byte comparisons for files
-    that are gigabytes large. If two files are the exact same size and have the same last modified time (within
-    a given range), they are treated equal as long as they are more than byte_limit bytes large. Otherwise,
-    filecmp.cmp() is run on both files.
+    Get a buffer belonging to the current thread that files can be read into. The same buffer is returned every
+    time it's asked for by the same thread, so it only has to be made once no matter how many files are read.
+    :param index: Which of the thread's buffers to get, for when more than one is needed at once, starting at 0.
+    :param size: The size of the buffer in bytes.
+    :return: A memoryview of the buffer.
+    """
+    buffers = getattr(THREAD_BUFFERS, "buffers", None)
+    if buffers is None:
+        buffers = THREAD_BUFFERS.buffers = {}
+    buffer = buffers.get((index, size))
+    if buffer is None:
+        buffer = buffers[(index, size)] = memoryview(bytearray(size))
+    return buffer
+
+
+def file_contents_equal(path1, path2, block_size=COMPARE_BLOCK_SIZE):
+    """
+    Checks if two files have the same contents by reading both side by side, stopping at the first block that
+    differs. Each file is read into a buffer that the current thread reuses for every block.
+    :param path1: The path of the first file.
+    :param path2: The path of the second file.
+    :param block_size: The number of bytes to read from each file at a time.
+    :return: True if both files have exactly the same contents, false otherwise.
+    """
+    view1 = get_thread_buffer(0, block_size)
+    view2 = get_thread_buffer(1, block_size)
+    with open(path1, "rb", buffering=0) as file1, open(path2, "rb", buffering=0) as file2:
+        while True:
+            read1 = file1.readinto(view1)
+            # Fill the same number of bytes from the second file, which may take more than one read
+            read2 = 0
+            while read2 < read1:
+                read_now = file2.readinto(view2[read2:read1])
+                if read_now == 0:
+                    return False
+                read2 += read_now
+            if read1 == 0:
+                return len(file2.read(1)) == 0
+            if view1[:read1] != view2[:read1]:
+                return False
+
+
+def file_compare(path1, path2, byte_limit=(50 * (2 ** 20)), mtime_delta=2, stats1=None, stats2=None,
+                 deep_compare=True):
+    """
+    Checks if two files should be considered equal. Files of different sizes are never equal, and files of the
+    same size and last modified time are always equal. Otherwise, if the files are over a certain size, they are
+    treated equal as long as their last modified times are within a given range, in order to avoid reading
+    files that are gigabytes large. Smaller files have their contents compared, stopping at the first difference.
+    If a deep compare isn't wanted, the contents are never read, and files are treated equal as long as their
+    sizes match and their last modified times are within the range.
     :param path1: The path of the first file. This is the one checked for the byte_limit.
     :param path2: The path of the second file.
-    :param byte_limit: The maximum size in bytes for which we should do byte-by-byte comparisons on the two
-                       files. By default, this is set to 100*2^20, or 104,857,600, which is 100MB.
+    :param byte_limit: The maximum size in bytes for which we should compare the contents of the two
+                       files. By default, this is set to 50*2^20, or 52,428,800, which is 50MB.
     :param mtime_delta: How much variation the last modified time can have to still be considered equal.
                         This is taken into account because rounding differences when copying a file from an
                         NTFS device to a FAT device sometimes cause the last modified time of a file to change
                         by 1 or 2 seconds. This is by default set to 2, so as long as the last modified time
                         of the two files are within 2 seconds of each other, they will be considered equal.
+    :param stats1: The result of os.stat() on the first file, if it's already known. None by default.
+    :param stats2: The result of os.stat() on the second file, if it's already known. None by default.
+    :param deep_compare: True to compare the contents of files that are under the byte limit. True by default.
     :return: True if the two files should be considered equal, false otherwise.
     """
-    stats1 = os.stat(path1)
-    stats2 = os.stat(path2)
-    # If the first file is larger than the byte limit, only compare file size and modified time
-    if stats1.st_size > byte_limit:
-        if stats1.st_size == stats2.st_size and abs(stats1.st_mtime - stats2.st_mtime) <= mtime_delta:
-            return True
+    if stats1 is None:
+        stats1 = os.stat(path1)
+    if stats2 is None:
+        stats2 = os.stat(path2)
+    # Files of different sizes can't be equal, and files with the same size and modified time are unchanged
+    if stats1.st_size != stats2.st_size:
+        return False
+    if stats1.st_mtime_ns == stats2.st_mtime_ns:
+        return True
+    # If the first file is larger than the byte limit, or contents shouldn't be compared, only compare modified time
+    if not deep_compare or stats1.st_size > byte_limit:
+        return abs(stats1.st_mtime - stats2.st_mtime) <= mtime_delta
+    # The contents are compared directly, which can stop as soon as a difference is found
+    return file_contents_equal(path1, path2)
+
+
+def fast_copy(source, destination):
+    """
+    Copy a file along with its permissions and last accessed and modified times, like shutil.copy2() does. Where
+    the filesystem supports it, the copy is made as a clone that shares the original's data on disk. Otherwise, where
+    the operating system supports it, the contents are copied within the kernel using os.copy_file_range() or
+    os.sendfile() if that can't be used, or failing that the file is copied in large blocks.
+    :param source: The path of the file to copy.
+    :param destination: The path to copy the file to. This will be overwritten if it already exists.
+    """
+    with open(source, "rb", opener=open_without_atime) as source_file, open(destination, "wb") as destination_file:
+        source_stats = os.fstat(source_file.fileno())
+        size = source_stats.st_size
+        if clone_file(source_file, destination_file):
+            copy_metadata(source_stats, destination)
+            return
+        preallocated = preallocate_file(destination_file, size)
+        advise_file(source_file, FADVISE_SEQUENTIAL)
+        copy_file_contents(source_file, destination_file, size)
+        # The source won't be read again, so don't let it push anything more useful out of the page cache
+        advise_file(source_file, FADVISE_DONTNEED)
+        # If the source got smaller while it was copied, don't leave the rest of the preallocated space at the end
+        if preallocated:
+            destination_file.truncate()
+    copy_metadata(source_stats, destination)
+
+
+def open_without_atime(path, flags):
+    """
+    Open a file to be copied without updating its last accessed time, where the operating system allows it. This
+    is meant to be given to open() as its opener. Only the owner of a file can open it this way, so it's opened
+    normally if that isn't allowed.
+    :param path: The path of the file to open.
+    :param flags: The flags to open the file with.
+    :return: The file descriptor of the opened file.
+    """
+    if NO_ATIME_FLAG:
+        try:
+            return os.open(path, flags | NO_ATIME_FLAG)
+        except PermissionError:
+            pass
+    return os.open(path, flags)
+
+
+def advise_file(file, advice):
+    """
+    Tell the operating system how an open file will be used, so it can read ahead or drop the file from its cache
+    accordingly. This does nothing where it isn't supported.
+    :param file: An open file object.
+    :param advice: One of the FADVISE constants, which is None if that advice isn't supported.
+    """
+    if advice is None:
+        return
+    try:
+        os.posix_fadvise(file.fileno(), 0, 0, advice)
+    except OSError:
+        pass
+
+
+def copy_metadata(source_stats, destination):
+    """
+    Set the last accessed and modified times and the permissions of a copied file to match the original. This
+    uses stats already read from the original, so it doesn't need to be looked up again like in shutil.copystat().
+    :param source_stats: The result of os.stat() on the original file.
+    :param destination: The path of the copy.
+    """
+    os.utime(destination, ns=(source_stats.st_atime_ns, source_stats.st_mtime_ns))
+    os.chmod(destination, stat.S_IMODE(source_stats.st_mode))
+
+
+def clone_file(source_file, destination_file):
+    """
+    Try to make a file a clone of another, so both share the same data on disk and nothing needs to be copied.
+    This only works on Linux, when both files are on the same filesystem and it supports copy-on-write.
+    :param source_file: A file object opened for reading in binary mode.
+    :param destination_file: An empty file object opened for writing in binary mode.
+    :return: True if the destination is now a clone of the source, false if it couldn't be cloned.
+    """
+    if not CLONE_SUPPORTED:
+        return False
+    try:
+        fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+    except OSError as error:
+        if error.errno not in CLONE_UNSUPPORTED_ERRORS:
+            raise
+        return False
+    return True
+
+
+def preallocate_file(file, size, min_size=PREALLOCATE_MIN_SIZE):
+    """
+    Reserve space on disk for a file that is about to be written, so the filesystem can place it all together
+    instead of growing it a piece at a time. This is only done on Linux filesystems that can reserve the space
+    without writing to it, and only for files large enough to benefit from it.
+    :param file: A file object opened for writing in binary mode.
+    :param size: The number of bytes that will be written to the file.
+    :param min_size: The smallest size of file to reserve space for.
+    :return: True if the space was reserved, false otherwise. Reserving the space also sets the size of the file.
+    """
+    if size < min_size or LINUX_FALLOCATE is None:
+        return False
+    # Not every filesystem supports this, in which case the file is written without it
+    return LINUX_FALLOCATE(file.fileno(), 0, 0, size) == 0
+
+
+def copy_file_contents(source_file, destination_file, size):
+    """
+    Copy the contents of one open file to another, trying the fastest method available first. Each method copies
+    from where the last one left off, so if one fails partway through, the next one will finish the copy.
+    :param source_file: A file object opened for reading in binary mode.
+    :param destination_file: A file object opened for writing in binary mode.
+    :param size: The number of bytes in the source file.
+    """
+    source_fd = source_file.fileno()
+    destination_fd = destination_file.fileno()
+    copied = 0
+
+    # Let the kernel copy the file directly between the two files
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < size:
+                sent = os.copy_file_range(source_fd, destination_fd, size - copied)
+                if sent == 0:
+                    break
+                copied += sent
+        except OSError as error:
+            if error.errno not in COPY_UNSUPPORTED_ERRORS:
+                raise
         else:
-            return False
-    # Otherwise, use the built in file compare
-    else:
-        return filecmp.cmp(path1, path2)
+            if copied >= size:
+                return
+
+    # Otherwise let the kernel send the file's pages to the destination
+    if SENDFILE_SUPPORTED:
+        try:
+            while copied < size:
+                sent = os.sendfile(destination_fd, source_fd, None, size - copied)
+                if sent == 0:
+                    break
+                copied += sent
+        except OSError as error:
+            if error.errno not in COPY_UNSUPPORTED_ERRORS:
+                raise
+        else:
+            if copied >= size:
+                return
+
+    # Finally, copy whatever is left of the file one block at a time through this thread's buffer
+    buffer = get_thread_buffer(0, COPY_BUFFER_SIZE)
+    for bytes_read in iter(lambda: source_file.readinto(buffer), 0):
+        destination_file.write(buffer[:bytes_read])
+
+
+def delta_copy(source, destination, block_size=DELTA_BLOCK_SIZE):
+    """
+    Update an existing copy of a file in place, so it matches the source file. Both files are read side by side,
+    and only the blocks of the destination that differ from the source are rewritten. This is meant for large
+    files where only a small part has changed, such as databases or disk images, so the whole file doesn't need
+    to be written again. The destination will be truncated or extended to match the size of the source, and the
+    source's metadata will be copied over like in fast_copy().
+    :param source: The path of the file to copy.
+    :param destination: The path of an existing copy of the file to update.
+    :param block_size: The size of the blocks that are compared and rewritten.
+    :return: The number of bytes that were written to the destination.
+    """
+    bytes_written = 0
+    offset = 0
+    with open(source, "rb", opener=open_without_atime) as source_file, open(destination, "r+b") as destination_file:
+        source_stats = os.fstat(source_file.fileno())
+        advise_file(source_file, FADVISE_SEQUENTIAL)
+        for source_chunk in iter(lambda: source_file.read(COPY_BUFFER_SIZE), b""):
+            destination_chunk = destination_file.read(len(source_chunk))
+            # Only look at the individual blocks of this chunk if something in it has changed
+            if source_chunk != destination_chunk:
+                for block_start in range(0, len(source_chunk), block_size):
+                    block = source_chunk[block_start:block_start+block_size]
+                    if block != destination_chunk[block_start:block_start+block_size]:
+                        destination_file.seek(offset + block_start)
+                        destination_file.write(block)
+                        bytes_written += len(block)
+                destination_file.seek(offset + len(source_chunk))
+            offset += len(source_chunk)
+        destination_file.truncate(offset)
+        advise_file(source_file, FADVISE_DONTNEED)
+    copy_metadata(source_stats, destination)
+    return bytes_written
 
 
 def rmtree(start_path):
@@ -199,6 +526,20 @@ def rmtree(start_path):
     return files_deleted
 
 
+def is_file_or_directory(path):
+    """
+    Check if a path points to an existing file or directory. This is the same as checking os.path.isdir and
+    os.path.isfile, but only stats the path once.
+    :param path: The path to check.
+    :return: True if the path is an existing file or directory, false otherwise.
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except (OSError, ValueError):
+        return False
+    return stat.S_ISDIR(mode) or stat.S_ISREG(mode)
+
+
 def path_is_in_directory(path_to_check, directory_path):
     """
     Checks if a given path to a directory or file is directly in a given directory and not